@@ -1,15 +1,24 @@
 if __name__ == '__main__':
     import pygame # >:)
-    from scripts import *
+    from scripts.playground import Playground
+    from scripts.const import Var
+    from scripts.util import get_monitor, set_icon
+    from scripts.profiler import profiler
 
+    get_monitor()
+    set_icon()
     playground = Playground()
     clock = pygame.time.Clock()
 
     while True:  
-        for event in pygame.event.get():
-            playground.handle_event(event)
+        with profiler.phase('events'):
+            for event in pygame.event.get():
+                playground.handle_event(event)
 
         playground.update()
-        pygame.display.flip()
-        clock.tick(Var.framerate_limit)
+        with profiler.phase('flip'):
+            pygame.display.flip()
+        with profiler.phase('idle'): # waiting for the framerate limit
+            clock.tick(Var.framerate_limit)
         pygame.display.set_caption(f'FPS: {clock.get_fps():.0f}')
+        profiler.end_frame()
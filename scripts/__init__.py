@@ -1,6 +0,0 @@
-from scripts.playground import Playground
-from scripts.const import Var
-from scripts.util import get_monitor, set_icon
-
-get_monitor()
-set_icon()
\ No newline at end of file
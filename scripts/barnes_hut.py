@@ -0,0 +1,131 @@
+import numpy as np
+from scripts import gravity
+
+MAX_DEPTH = 16 # quadtree depth, morton codes use MAX_DEPTH bits per axis
+
+def _spread_bits(values:np.ndarray) -> np.ndarray:
+    """Insert a zero bit between each of the lower 16 bits"""
+    values = values.astype(np.int64) & 0xFFFF
+    values = (values | (values << 8)) & 0x00FF00FF
+    values = (values | (values << 4)) & 0x0F0F0F0F
+    values = (values | (values << 2)) & 0x33333333
+    values = (values | (values << 1)) & 0x55555555
+    return values
+
+class QuadTree:
+    """Linear quadtree built level by level from sorted morton codes
+
+    Every level stores center of mass, total mass and amount of bodies per node.
+    Children of a node are a contiguous range in the next level"""
+    def __init__(self, positions:np.ndarray, masses:np.ndarray):
+        low = positions.min(axis=0)
+        self.width = float(max(np.ptp(positions, axis=0).max(), 1e-9)) * (1 + 1e-9)
+        cells = ((positions - low) / self.width * (1 << MAX_DEPTH)).astype(np.int64)
+        cells = np.minimum(cells, (1 << MAX_DEPTH) - 1)
+        codes = _spread_bits(cells[:, 0]) << 1 | _spread_bits(cells[:, 1])
+        self.codes = codes # of every body in input order, the key of its node on a level is codes >> shift(level)
+
+        order = np.argsort(codes, kind='stable')
+        codes = codes[order]
+        sorted_masses = masses[order]
+        weighted = positions[order] * sorted_masses[:, np.newaxis]
+
+        self.keys:list[np.ndarray] = []
+        self.mass:list[np.ndarray] = []
+        self.com:list[np.ndarray] = []
+        self.count:list[np.ndarray] = []
+        self.child_start:list[np.ndarray] = []
+        keys_prev = None
+
+        for level in range(MAX_DEPTH + 1):
+            keys = codes >> self.shift(level)
+            first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            node_keys = keys[first]
+            mass = np.add.reduceat(sorted_masses, first)
+            count = np.diff(np.r_[first, len(codes)])
+            com = np.add.reduceat(weighted, first, axis=0) / mass[:, np.newaxis]
+            single = count == 1
+            com[single] = positions[order[first[single]]] # exact position, mass * position / mass can be off by a rounding
+            self.keys.append(node_keys)
+            self.mass.append(mass)
+            self.com.append(com)
+            self.count.append(count)
+
+            if keys_prev is not None: # children of previous level are contiguous, find where each range starts
+                parents = np.searchsorted(keys_prev, node_keys >> 2)
+                self.child_start.append(np.searchsorted(parents, np.arange(len(keys_prev) + 1)))
+            keys_prev = node_keys
+
+            if len(first) == len(codes): # every body has its own node, no need to go deeper
+                break
+
+        self.depth = len(self.mass) - 1
+        self.order = order # bodies sorted by code, the bodies of a deepest node are order[first:first + count]
+        self.first = first # of the nodes on the deepest level
+
+    @staticmethod
+    def shift(level:int) -> int:
+        return 2 * (MAX_DEPTH - level)
+
+    def contains(self, level:int, nodes:np.ndarray, bodies:np.ndarray) -> np.ndarray:
+        """Whether each node on level holds the body it is paired with"""
+        return self.keys[level][nodes] == self.codes[bodies] >> self.shift(level)
+
+def accelerations(positions:np.ndarray, masses:np.ndarray, theta:float, G:float, softening:float=0.0, kernel:str='plummer') -> np.ndarray:
+    """Approximate accelerations with a Barnes-Hut quadtree
+
+    All bodies walk the tree together, one level per iteration. Every (body, node) pair
+    is either accepted as a point mass, or replaced by the pairs of the node's children.
+    A node around the body itself is always opened, deepest nodes left open are summed
+    body by body, so theta 0 is exact"""
+    n = len(positions)
+    acc = np.zeros((n, 2), dtype=np.float64)
+    if not n:
+        return acc
+    tree = QuadTree(positions, masses)
+    bodies = np.arange(n)
+    nodes = np.zeros(n, dtype=np.int64)
+    theta_sq = theta * theta
+
+    def add(bodies:np.ndarray, mass:np.ndarray, diff:np.ndarray, distances_sq:np.ndarray):
+        valid = distances_sq > 0 # the body itself, or balls on the same spot
+        _, inv_distances_cubed = gravity.inverse_distances(distances_sq[valid], softening, kernel)
+        contribution = G * (mass[valid] * inv_distances_cubed)[:, np.newaxis] * diff[valid]
+        acc[:, 0] += np.bincount(bodies[valid], contribution[:, 0], n)
+        acc[:, 1] += np.bincount(bodies[valid], contribution[:, 1], n)
+
+    def expand(bodies:np.ndarray, start:np.ndarray, amount:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Pair every body with the amount entries from start on"""
+        offsets = np.arange(amount.sum()) - np.repeat(np.cumsum(amount) - amount, amount)
+        return np.repeat(bodies, amount), np.repeat(start, amount) + offsets
+
+    for level in range(tree.depth + 1):
+        com = tree.com[level][nodes]
+        count = tree.count[level][nodes]
+        diff = com - positions[bodies]
+        distances_sq = diff[:, 0]**2 + diff[:, 1]**2
+        size = tree.width / (1 << level)
+
+        accept = (count == 1) | (size * size < theta_sq * distances_sq)
+        close = np.flatnonzero(accept & (count > 1) & (distances_sq <= 2 * size * size)) # only these can be around the body
+        accept[close] = ~tree.contains(level, nodes[close], bodies[close]) # a node around the body always gets opened
+        add(bodies[accept], tree.mass[level][nodes[accept]], diff[accept], distances_sq[accept])
+
+        bodies = bodies[~accept]
+        nodes = nodes[~accept]
+        if not len(bodies):
+            break
+
+        if level == tree.depth: # balls closer than the deepest cells, summed directly
+            bodies, members = expand(bodies, tree.first[nodes], count[~accept])
+            members = tree.order[members]
+            others = members != bodies
+            bodies, members = bodies[others], members[others]
+            diff = positions[members] - positions[bodies]
+            add(bodies, masses[members], diff, diff[:, 0]**2 + diff[:, 1]**2)
+            break
+
+        start = tree.child_start[level][nodes]
+        bodies, nodes = expand(bodies, start, tree.child_start[level][nodes + 1] - start)
+
+    return acc
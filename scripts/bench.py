@@ -0,0 +1,323 @@
+"""Benchmarks of the physics engine, runs without pygame
+
+python -m scripts.bench forces --amounts 100 1000 4000
+python -m scripts.bench precision --preset figure_8 --steps 20000
+python -m scripts.bench encounters --dt 0.03 --factors 1 10
+python -m scripts.bench suite --out bench.json --baseline baseline.json
+python -m scripts.bench compare baseline.json bench.json"""
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+from types import SimpleNamespace
+import numpy as np
+from scripts.physics import PhysicsEngine
+from scripts.settings import Var
+from scripts.run import simulate
+from scripts.startpos import get_preset
+
+def measure(function, repeat:int=5, warmup:int=1) -> float:
+    """Best time of repeat calls in seconds, after warmup calls that are not counted"""
+    for _ in range(warmup):
+        function()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def timings(function, repeat:int=5, budget:float=2.0) -> list[float]:
+    """Seconds of up to repeat calls, stops early once budget seconds are used up. The warmup call is skipped when it alone takes longer"""
+    start = time.perf_counter()
+    function()
+    first = time.perf_counter() - start
+    if first > budget:
+        return [first]
+    result = []
+    while len(result) < repeat and (not result or sum(result) + first < budget):
+        start = time.perf_counter()
+        function()
+        result.append(time.perf_counter() - start)
+    return result
+
+def random_engine(amount:int, seed:int=0, **kwargs) -> PhysicsEngine:
+    """Engine with amount balls spread over the default window, nothing simulated yet"""
+    rng = np.random.default_rng(seed)
+    engine = PhysicsEngine(0.03, **kwargs)
+    engine.from_arrays(
+        rng.uniform(0, 800, (amount, 2)),
+        rng.normal(0, 1, (amount, 2)),
+        rng.uniform(1, 10, amount),
+        update=False,
+    )
+    return engine
+
+def forces(amounts:list[int], repeat:int=5) -> dict[str, dict[int, float]]:
+    """Seconds per call of every force method, prints the speedup over direct summation"""
+    results = {name: {} for name in PhysicsEngine.force_methods}
+    for amount in amounts:
+        engine = random_engine(amount)
+        reference = engine.compute_accelerations()
+        for name, method in PhysicsEngine.force_methods.items():
+            function = getattr(engine, method)
+            error = np.max(np.abs(function() - reference)) / np.max(np.abs(reference))
+            results[name][amount] = measure(function, repeat)
+            print(f'{amount:>7} {name:>10}: {results[name][amount]*1000:9.2f}ms {results["direct"][amount] / results[name][amount]:6.2f}x  error {error:.1e}')
+    return results
+
+def precision(preset:str='figure_8', steps:int=20000, dt:float=0.03, methods:list[str]=None, amount:int=1000) -> dict[str, dict]:
+    """Accuracy report of float32 against float64
+
+    Every method integrates the preset in both precisions, compared are the energy drift, how far the
+    float32 orbit ends up from the float64 one and the time. The force error is measured on amount random balls"""
+    results = {}
+    arrays = get_preset(preset) # both precisions start from the same setup
+    for method in methods or PhysicsEngine.methods:
+        runs = {}
+        for dtype in ('float64', 'float32'):
+            engine = PhysicsEngine(dt, dtype=dtype)
+            engine.method = getattr(engine, f'{method}_step')
+            engine.from_arrays(*arrays, update=False)
+            start = time.perf_counter()
+            snapshots = simulate(engine, steps, max(1, steps // 100))
+            energy = snapshots['kinetic'] + snapshots['potential']
+            runs[dtype] = {
+                'seconds': time.perf_counter() - start,
+                'drift': float(np.max(np.abs((energy - energy[0]) / energy[0]))),
+                'positions': snapshots['positions'],
+            }
+        apart = float(np.max(np.abs(runs['float32']['positions'] - runs['float64']['positions'])))
+        results[method] = {dtype: {k: v for k, v in run.items() if k != 'positions'} for dtype, run in runs.items()}
+        results[method]['apart'] = apart
+        print(f'{method:>12}: drift float64 {runs["float64"]["drift"]:.2e} float32 {runs["float32"]["drift"]:.2e}, '
+              f'{apart:.2e} apart, {runs["float64"]["seconds"]:.2f}s / {runs["float32"]["seconds"]:.2f}s')
+
+    reference = random_engine(amount, dtype='float64')
+    single = random_engine(amount, dtype='float32')
+    for name, method in PhysicsEngine.force_methods.items():
+        expected = getattr(reference, method)()
+        error = np.max(np.abs(getattr(single, method)() - expected)) / np.max(np.abs(expected))
+        seconds = measure(getattr(reference, method)), measure(getattr(single, method))
+        results[name] = {'error': float(error), 'float64': seconds[0], 'float32': seconds[1]}
+        print(f'{name:>12}: float32 force error {error:.1e} at {amount} balls, {seconds[0]*1000:.2f}ms / {seconds[1]*1000:.2f}ms')
+    return results
+
+def tight_binary(eccentricity:float=0.8, perturbers:int=4) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Eccentric binary with period 5 at apoapsis, circled by a few light balls further out"""
+    mass, semi_major = 50.0, 4.0
+    apoapsis = semi_major * (1 + eccentricity)
+    speed = np.sqrt(2 * mass / apoapsis * (1 - eccentricity)) / 2 # each ball, G = 1
+    positions = [[400 - apoapsis/2, 400], [400 + apoapsis/2, 400]]
+    velocities = [[0, -speed], [0, speed]]
+    for angle in np.linspace(0, 2*np.pi, perturbers, endpoint=False):
+        radius = 60 + 15 * angle
+        direction = np.array([np.cos(angle), np.sin(angle)])
+        positions.append(400 + radius * direction)
+        velocities.append(np.sqrt(2 * mass / radius) * direction[::-1] * [-1, 1])
+    masses = np.array([mass, mass] + [1.0] * perturbers)
+    return np.array(positions, dtype=float), np.array(velocities, dtype=float), np.sqrt(masses / np.pi), masses
+
+def encounters(dt:float=0.03, factors:list[int]=None, duration:float=150.0, method:str='verlet', softening:float=1.0) -> dict[str, dict[int, float]]:
+    """Energy drift of a tight eccentric binary with plain newton, softening and regularization
+
+    Every variant runs the same simulated time at dt times each factor, so it shows how much larger a
+    timestep each one tolerates. Softening changes the potential, its drift is measured against its own energy"""
+    variants = {
+        'newton': {},
+        'plummer': {'softening': softening, 'softening_kernel': 'plummer'},
+        'spline': {'softening': softening, 'softening_kernel': 'spline'},
+        'regularized': {'regularize': True},
+    }
+    results = {name: {} for name in variants}
+    for name, attributes in variants.items():
+        for factor in factors or [1, 10]:
+            engine = PhysicsEngine(dt * factor)
+            engine.method = getattr(engine, f'{method}_step')
+            for key, value in attributes.items():
+                setattr(engine, key, value)
+            engine.from_arrays(*tight_binary(), update=False)
+            steps = int(round(duration / (dt * factor)))
+            start = time.perf_counter()
+            snapshots = simulate(engine, steps, max(1, steps // 200))
+            energy = snapshots['kinetic'] + snapshots['potential']
+            drift = float(np.max(np.abs((energy - energy[0]) / energy[0])))
+            results[name][factor] = drift
+            print(f'{name:>12} dt {dt*factor:<6g}: drift {drift:.2e} in {time.perf_counter() - start:.2f}s')
+    return results
+
+PAIR_BYTES = 72 # (N, N) temporaries of the numpy direct summation and potential, per pair in float64
+
+def suite(amounts:list[int], buffers:list[int], repeat:int=5, budget:float=2.0, max_memory:float=2.0, backend:str='numpy', dtype:str='float64') -> dict:
+    """Time the hot paths of the engine at every amount of balls, returns a json-able report
+
+    Cases whose (N, N) temporaries would need more than max_memory GB are skipped, the steps then run with
+    the tiled force instead of the direct one (same result, bounded memory) and say so in the report.
+    add_ball/remove_ball run once with a buffer of 2, where repredict simulates nothing and only the bookkeeping
+    is timed, and once per buffer, where simulating the prediction again is most of the cost. Those are skipped
+    when update_physics says one call would take longer than budget"""
+    results = {}
+
+    def case(name:str, amount:int, function, memory:float=0.0, **info):
+        key = f'{name}[n={amount}]'
+        if memory > max_memory * 1e9:
+            results[key] = {'skipped': f'needs {memory/1e9:.1f}GB, more than --max-memory'}
+            print(f'{key:>36}: skipped')
+            return
+        runs = timings(function, repeat, budget)
+        results[key] = {'best': min(runs), 'median': float(np.median(runs)), 'runs': len(runs), **info}
+        print(f'{key:>36}: {min(runs)*1000:10.3f}ms best of {len(runs)}')
+
+    for amount in amounts:
+        pairs = amount**2 * PAIR_BYTES * np.dtype(dtype).itemsize / 8
+        force = 'direct' if pairs <= max_memory * 1e9 else 'tiled'
+        engine = random_engine(amount, backend=backend, dtype=dtype)
+        engine.force_method = getattr(engine, PhysicsEngine.force_methods[force])
+
+        case('compute_accelerations', amount, engine.compute_accelerations, pairs)
+        case('euler_step', amount, lambda: engine.euler_step(engine.dt), force=force)
+        case('runge_kutta_step', amount, lambda: engine.runge_kutta_step(engine.dt), force=force)
+        case('kinetic', amount, engine.kinetic)
+        case('potential', amount, engine.potential, pairs)
+
+        collider = random_engine(amount, collisions=True, backend=backend, dtype=dtype)
+        collider.radii = np.full(amount, 800 / np.sqrt(amount)) # about one overlap per ball
+        start_pos, start_vel = collider.positions.copy(), collider.velocities.copy()
+        def collide():
+            collider.positions, collider.velocities = start_pos, start_vel # every call sees the same overlaps
+            collider.handle_collisions()
+        case('handle_collisions', amount, collide)
+
+        def filled(buffer:int) -> PhysicsEngine:
+            """Engine with a full history without simulating it, only the steady state is timed"""
+            engine = random_engine(amount, backend=backend, dtype=dtype)
+            engine.force_method = getattr(engine, PhysicsEngine.force_methods[force])
+            engine.buffer = buffer
+            engine.history.resize(buffer)
+            for _ in range(buffer):
+                engine.history.append(engine.positions, engine.velocities)
+            return engine
+
+        ball = SimpleNamespace(pos=np.zeros(2), vel=np.zeros(2), radius=5.0, mass=np.pi * 25)
+        spots = np.random.default_rng(1)
+        def add(engine:PhysicsEngine):
+            ball.pos = spots.uniform(0, 800, 2) # never on top of another ball
+            engine.add_ball(ball)
+
+        editor = random_engine(amount, buffer=2, backend=backend, dtype=dtype)
+        case('add_ball', amount, lambda: add(editor))
+        case('remove_ball', amount, lambda: editor.remove_ball(0))
+
+        for buffer in buffers:
+            stepper = filled(buffer)
+            history = 4 * buffer * amount * 2 * np.dtype(dtype).itemsize # positions and velocities, written twice
+            case(f'update_physics:buffer={buffer}', amount, lambda: stepper.update_physics(steps=1), history, force=force)
+
+            step = results[f'update_physics:buffer={buffer}[n={amount}]'].get('best')
+            if step is None: # skipped
+                continue
+            editor = filled(buffer)
+            estimate = step * (buffer//2 - 1) * Var.steps_per_draw # repredict simulates the prediction half again
+            for name, function in (('add_ball', lambda: add(editor)), ('remove_ball', lambda: editor.remove_ball(0))):
+                if estimate > budget:
+                    key = f'{name}:buffer={buffer}[n={amount}]'
+                    results[key] = {'skipped': f'about {estimate:.0f}s per call, more than --budget'}
+                    print(f'{key:>36}: skipped')
+                else:
+                    case(f'{name}:buffer={buffer}', amount, function, history, force=force)
+
+    return {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'backend': backend,
+            'dtype': dtype,
+        },
+        'results': results,
+    }
+
+def compare(baseline:dict, current:dict, threshold:float=0.1, floor:float=1e-5) -> list[str]:
+    """Print every case both reports timed, returns the ones that got slower by more than threshold
+
+    Differences below floor seconds count as noise"""
+    regressions = []
+    for key, old in baseline['results'].items():
+        new = current['results'].get(key)
+        if new is None or 'best' not in old or 'best' not in new:
+            continue
+        ratio = new['best'] / old['best']
+        if new['best'] - old['best'] > floor and ratio > 1 + threshold:
+            verdict = 'REGRESSION'
+            regressions.append(key)
+        elif old['best'] - new['best'] > floor and ratio < 1 / (1 + threshold):
+            verdict = 'faster'
+        else:
+            verdict = ''
+        print(f'{key:>36}: {old["best"]*1000:10.3f}ms -> {new["best"]*1000:10.3f}ms {ratio:6.2f}x {verdict}')
+    return regressions
+
+def main(argv:list[str]=None):
+    parser = argparse.ArgumentParser(prog='python -m scripts.bench', description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    parser_forces = commands.add_parser('forces', help='time every force method against direct summation')
+    parser_forces.add_argument('--amounts', nargs='+', type=int, default=[100, 1000, 3000])
+    parser_forces.add_argument('--repeat', type=int, default=5)
+    parser_precision = commands.add_parser('precision', help='energy drift and force error of float32 against float64')
+    parser_precision.add_argument('--preset', default='figure_8')
+    parser_precision.add_argument('--steps', type=int, default=20000)
+    parser_precision.add_argument('--dt', type=float, default=0.03)
+    parser_precision.add_argument('--methods', nargs='+', choices=PhysicsEngine.methods)
+    parser_precision.add_argument('--amount', type=int, default=1000, help='balls for the force error')
+    parser_encounters = commands.add_parser('encounters', help='energy drift of a tight binary with softening and regularization')
+    parser_encounters.add_argument('--dt', type=float, default=0.03)
+    parser_encounters.add_argument('--factors', nargs='+', type=int, default=[1, 10], help='timestep multiples to compare')
+    parser_encounters.add_argument('--duration', type=float, default=150.0, help='simulated time')
+    parser_encounters.add_argument('--method', default='verlet', choices=('verlet', 'yoshida'))
+    parser_encounters.add_argument('--softening', type=float, default=1.0)
+    parser_suite = commands.add_parser('suite', help='time the hot paths of the engine and write them to json')
+    parser_suite.add_argument('--amounts', nargs='+', type=int, default=[3, 100, 1000, 10000])
+    parser_suite.add_argument('--buffers', nargs='+', type=int, default=[10, 100, 1000], help='history sizes for update_physics')
+    parser_suite.add_argument('--repeat', type=int, default=5)
+    parser_suite.add_argument('--budget', type=float, default=2.0, help='seconds per case, slow cases run fewer times')
+    parser_suite.add_argument('--max-memory', type=float, default=2.0, help='GB, cases needing more get skipped')
+    parser_suite.add_argument('--backend', default='numpy', choices=PhysicsEngine.backends)
+    parser_suite.add_argument('--dtype', default='float64', choices=('float64', 'float32'))
+    parser_suite.add_argument('--out', default='bench.json')
+    parser_suite.add_argument('--baseline', help='compare against this report right away')
+    parser_suite.add_argument('--threshold', type=float, default=0.1, help='relative slowdown that counts as regression')
+    parser_compare = commands.add_parser('compare', help='compare two suite reports, exits with 1 on regressions')
+    parser_compare.add_argument('baseline')
+    parser_compare.add_argument('current')
+    parser_compare.add_argument('--threshold', type=float, default=0.1, help='relative slowdown that counts as regression')
+    args = parser.parse_args(argv)
+
+    if args.command == 'forces':
+        forces(args.amounts, args.repeat)
+    elif args.command == 'precision':
+        precision(args.preset, args.steps, args.dt, args.methods, args.amount)
+    elif args.command == 'encounters':
+        encounters(args.dt, args.factors, args.duration, args.method, args.softening)
+    elif args.command == 'suite':
+        report = suite(args.amounts, args.buffers, args.repeat, args.budget, args.max_memory, args.backend, args.dtype)
+        with open(args.out, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f'saved to {args.out}')
+        if args.baseline:
+            with open(args.baseline) as file:
+                sys.exit(bool(compare(json.load(file), report, args.threshold)))
+    elif args.command == 'compare':
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.current) as file:
+            current = json.load(file)
+        regressions = compare(baseline, current, args.threshold)
+        print(f'{len(regressions)} regressions' if regressions else 'no regressions')
+        sys.exit(bool(regressions))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Checkpoints of the whole engine as uncompressed .npz, see PhysicsEngine.state and load_state"""
+from __future__ import annotations
+import os
+import threading
+import numpy as np
+from scripts.physics import PhysicsEngine
+
+def save(path:str, state:dict[str, np.ndarray]):
+    """Write a state, goes to a temporary file first so a crash never leaves half a checkpoint behind"""
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as file: # a file object, so savez does not append .npz
+        np.savez(file, **state)
+    os.replace(temporary, path)
+
+def load(path:str) -> dict[str, np.ndarray]:
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+def restore(path:str) -> tuple[PhysicsEngine, dict[str, np.ndarray]]:
+    """New engine that continues exactly where the checkpoint left off, and the state with the extra arrays it was submitted with"""
+    state = load(path)
+    engine = PhysicsEngine(float(state['dt']), buffer=int(state['buffer']), dtype=state['positions'].dtype)
+    engine.load_state(state)
+    return engine, state
+
+class Checkpointer:
+    """Writes checkpoints on a background thread so the simulation keeps going
+
+    submit only copies the state, the writing happens in the background. If the last
+    checkpoint is still being written the new one is skipped instead of waiting for it"""
+    def __init__(self, path:str):
+        self.path = path
+        self.thread:threading.Thread = None
+        self.written = 0
+        self.skipped = 0
+
+    def __repr__(self):
+        return f'<Checkpointer {self.path} written:{self.written} skipped:{self.skipped}>'
+
+    @property
+    def busy(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def submit(self, engine:PhysicsEngine, **extra) -> bool:
+        """Start writing the current state of engine and extra arrays, returns False if it got skipped"""
+        if self.busy:
+            self.skipped += 1
+            return False
+        state = engine.state()
+        state.update((name, np.asarray(value)) for name, value in extra.items())
+        self.thread = threading.Thread(target=self._write, args=(state,), daemon=True)
+        self.thread.start()
+        return True
+
+    def wait(self):
+        """Block until the checkpoint being written is done"""
+        if self.thread is not None:
+            self.thread.join()
+
+    def _write(self, state:dict[str, np.ndarray]):
+        save(self.path, state)
+        self.written += 1
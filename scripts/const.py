@@ -1,6 +1,6 @@
 import pygame
-import numpy as np
 from scripts.util import resource_path
+from scripts.settings import Var
 
 pygame.font.init()
 class Fonts:
@@ -39,22 +39,14 @@ class Colors:
     area_total.a = 50
     area_potential.a = 50
     
+    # Profiler panel
+    profile_background = pygame.Color(0, 0, 0, 120)
+    profile_bar = pygame.Color('#3498db')
+
     # Various
     background = pygame.Color('#292929')
     vel_vector = pygame.Color('#4e9c60')
     grid = pygame.Color('#5886bb')
     text = pygame.Color('#afafaf')
 
-class Var:
-    window_size = np.array((800, 800)) # standard window size in pixel
-    monitor_size = np.array((1920,1080)) # default size of monitor, used for fullscreen, changed to real resolution on startup
-    slider_size = (100, 20) # x and y size of the sliders in pixel
-    button_font = Fonts.large # font for the buttons
-    framerate_limit = 150 # fps limit, because i feel like its a good idea idk...
-    steps_per_draw = 20 # amt of physics steps. helps boost performance
-    dtype = float # precision control hopefully
-    G = 1 # universal gravitational standard
-    cicrcle_lightness = 75 # l value from hsLa used for making circle a nice pastel color
-    dampening = 0.998 # used in elastic collision only
-    pad = 5 # 5 pixel padding for ui elements (except ball ofc)
-    energy_graph_size = np.array((200, 150)) # width and height of energy graph
+Var.button_font = Fonts.large # font for the buttons
@@ -0,0 +1,130 @@
+from __future__ import annotations
+import numpy as np
+from scripts.settings import Var
+from scripts import gravity
+from scripts.physics import PhysicsEngine, YOSHIDA_WEIGHTS
+
+class Ensemble:
+    """Many independent universes of the same amount of balls, stepped together
+
+    State is stored as (B, N, 2) arrays, every universe can have its own dt and masses.
+    Universes that diverged are frozen and no longer advanced"""
+    methods = ('euler', 'runge_kutta', 'verlet', 'yoshida')
+
+    def __init__(self, positions:np.ndarray, velocities:np.ndarray, masses:np.ndarray, dt:float | np.ndarray, method:str='verlet'):
+        self.positions = np.array(positions, dtype=np.float64)
+        self.velocities = np.array(velocities, dtype=np.float64)
+        count = len(self.positions)
+        self.masses = np.broadcast_to(np.asarray(masses, dtype=np.float64), self.positions.shape[:2]).copy()
+        self.dt = np.broadcast_to(np.asarray(dt, dtype=np.float64), (count,)).copy()
+        self.method = getattr(self, f'{method}_step')
+        self.acc:np.ndarray = None # accelerations of the current positions, carried over by verlet_step
+        self.diverged = np.zeros(count, dtype=bool)
+        self.steps = 0
+        self.initial_energy = self.energy()
+
+    def __repr__(self):
+        return f'<Ensemble universes:{len(self.positions)} amt:{self.positions.shape[1]} diverged:{self.diverged.sum()}>'
+
+    def __len__(self):
+        return len(self.positions)
+
+    @classmethod
+    def from_engine(cls, engine:PhysicsEngine, count:int, method:str='verlet') -> Ensemble:
+        """count copies of the current state of an engine"""
+        return cls(
+            np.repeat(engine.positions[np.newaxis], count, axis=0),
+            np.repeat(engine.velocities[np.newaxis], count, axis=0),
+            np.repeat(engine.masses[np.newaxis], count, axis=0),
+            engine.dt,
+            method,
+        )
+
+    def perturb(self, scale:float, seed:int=None):
+        """Add gaussian noise of relative size scale to all velocities"""
+        rng = np.random.default_rng(seed)
+        self.velocities *= 1 + rng.normal(0, scale, self.velocities.shape)
+        self.acc = None
+        self.initial_energy = self.energy()
+
+    def compute_accelerations(self) -> np.ndarray:
+        """Calculates accelerations of all universes at once"""
+        diff = self.positions[:, np.newaxis, :, :] - self.positions[:, :, np.newaxis, :]
+        distances_sq = np.sum(diff**2, axis=3)
+        diagonal = np.arange(self.positions.shape[1])
+        distances_sq[:, diagonal, diagonal] = np.inf
+        _, inv_distances_cubed = gravity.inverse_distances(distances_sq, Var.softening, Var.softening_kernel)
+        return Var.G * np.einsum('bij,bijk->bik', inv_distances_cubed * self.masses[:, np.newaxis, :], diff)
+
+    def euler_step(self, dt:np.ndarray):
+        self.velocities += self.compute_accelerations() * dt
+        self.positions += self.velocities * dt
+
+    def runge_kutta_step(self, dt:np.ndarray):
+        orig_pos = self.positions.copy()
+        orig_vel = self.velocities.copy()
+
+        k1_acc = self.compute_accelerations()
+        k1_vel = orig_vel
+        self.positions = orig_pos + k1_vel * (dt * 0.5)
+        k2_acc = self.compute_accelerations()
+        k2_vel = orig_vel + k1_acc * (dt * 0.5)
+        self.positions = orig_pos + k2_vel * (dt * 0.5)
+        k3_acc = self.compute_accelerations()
+        k3_vel = orig_vel + k2_acc * (dt * 0.5)
+        self.positions = orig_pos + k3_vel * dt
+        k4_acc = self.compute_accelerations()
+        k4_vel = orig_vel + k3_acc * dt
+
+        self.positions = orig_pos + (dt/6.0) * (k1_vel + 2*k2_vel + 2*k3_vel + k4_vel)
+        self.velocities = orig_vel + (dt/6.0) * (k1_acc + 2*k2_acc + 2*k3_acc + k4_acc)
+
+    def verlet_step(self, dt:np.ndarray):
+        if self.acc is None:
+            self.acc = self.compute_accelerations()
+        self.velocities += self.acc * (dt * 0.5)
+        self.positions += self.velocities * dt
+        self.acc = self.compute_accelerations()
+        self.velocities += self.acc * (dt * 0.5)
+
+    def yoshida_step(self, dt:np.ndarray):
+        for weight in YOSHIDA_WEIGHTS:
+            self.verlet_step(dt * weight)
+
+    def step(self, steps:int=1):
+        """Advance every universe that has not diverged by steps * its own dt"""
+        dt = np.where(self.diverged, 0.0, self.dt)[:, np.newaxis, np.newaxis]
+        with np.errstate(all='ignore'): # diverged universes may hold inf or nan
+            for _ in range(steps):
+                self.method(dt)
+        self.steps += steps
+
+    def kinetic(self) -> np.ndarray:
+        """Kinetic energy per universe, shape (B,)"""
+        return 0.5 * np.sum(self.masses * np.sum(self.velocities**2, axis=2), axis=1)
+
+    def potential(self) -> np.ndarray:
+        """Potential energy per universe, shape (B,)"""
+        diff = self.positions[:, np.newaxis, :, :] - self.positions[:, :, np.newaxis, :]
+        distances_sq = np.sum(diff**2, axis=3)
+        diagonal = np.arange(self.positions.shape[1])
+        distances_sq[:, diagonal, diagonal] = np.inf
+        masses_matrix = self.masses[:, :, np.newaxis] * self.masses[:, np.newaxis, :]
+        inv_distances, _ = gravity.inverse_distances(distances_sq, Var.softening, Var.softening_kernel)
+        return -Var.G * np.sum(masses_matrix * inv_distances, axis=(1, 2)) / 2.0
+
+    def energy(self) -> np.ndarray:
+        """Total energy per universe, shape (B,)"""
+        with np.errstate(all='ignore'):
+            return self.kinetic() + self.potential()
+
+    def check_divergence(self, tolerance:float=1e-2) -> np.ndarray:
+        """Freeze universes whose energy left the relative tolerance or stopped being finite
+
+        Returns the diverged mask"""
+        energy = self.energy()
+        with np.errstate(all='ignore'):
+            drift = np.abs((energy - self.initial_energy) / self.initial_energy)
+        finite = np.isfinite(self.positions).all(axis=(1, 2)) & np.isfinite(energy)
+        self.diverged |= ~finite | (drift > tolerance)
+        return self.diverged
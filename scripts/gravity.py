@@ -0,0 +1,96 @@
+"""Softened pair kernels and the two body kepler solver used for regularized pairs"""
+import numpy as np
+from math import pi
+
+softening_kernels = ('plummer', 'spline')
+SPLINE_SCALE = 2.8 # spline support per plummer softening length, so both soften about the same
+
+def inverse_distances(distances_sq:np.ndarray, softening:float=0.0, kernel:str='plummer') -> tuple[np.ndarray, np.ndarray]:
+    """Softened 1/r and 1/r³ of squared distances, for potentials and forces
+
+    plummer: 1/sqrt(r² + ε²), smooth everywhere but never exactly newton.
+    spline: cubic spline (monaghan & lattanzio) with support 2.8ε, exactly newton beyond that"""
+    if softening <= 0:
+        inv_distances = 1/np.sqrt(distances_sq)
+        return inv_distances, inv_distances**3
+
+    if kernel == 'plummer':
+        inv_distances = 1/np.sqrt(distances_sq + softening**2)
+        return inv_distances, inv_distances**3
+
+    if kernel == 'spline':
+        h = SPLINE_SCALE * softening
+        distances = np.sqrt(distances_sq)
+        with np.errstate(divide='ignore'):
+            inv_distances = 1/distances
+        inv_distances_cubed = inv_distances**3
+        u = distances / h
+        inner = u < 0.5
+        outer = (0.5 <= u) & (u < 1)
+        ui = u[inner]
+        inv_distances[inner] = (2.8 - ui**2 * (16/3 + ui**2 * (6.4*ui - 9.6))) / h
+        inv_distances_cubed[inner] = (32/3 + ui**2 * (32*ui - 38.4)) / h**3
+        uo = u[outer]
+        inv_distances[outer] = (3.2 - 1/(15*uo) - uo**2 * (32/3 + uo * (-16 + uo * (9.6 - 32/15*uo)))) / h
+        inv_distances_cubed[outer] = (64/3 - 48*uo + 38.4*uo**2 - 32/3*uo**3 - 1/(15*uo**3)) / h**3
+        return inv_distances, inv_distances_cubed
+
+    raise ValueError(f'unknown softening kernel {kernel!r}, use one of {softening_kernels}')
+
+def newton_distance(softening:float=0.0, kernel:str='plummer') -> float:
+    """Distance from which on the kernel is exactly newton, inf for plummer"""
+    if softening <= 0:
+        return 0.0
+    if kernel == 'spline':
+        return SPLINE_SCALE * softening
+    return np.inf
+
+def periapsis(positions:np.ndarray, velocities:np.ndarray, mu:np.ndarray) -> np.ndarray:
+    """Closest distance of bound pairs on their kepler orbit, positions and velocities relative (pairs, 2)"""
+    alpha = 2/np.sqrt(np.sum(positions**2, axis=1)) - np.sum(velocities**2, axis=1) / mu # inverse semi major axis
+    momentum = positions[:, 0] * velocities[:, 1] - positions[:, 1] * velocities[:, 0]
+    eccentricity = np.sqrt(np.maximum(0, 1 - momentum**2 * alpha / mu))
+    return (1 - eccentricity) / alpha
+
+def stumpff(z:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Stumpff functions C(z) and S(z) for z >= 0, series close to 0"""
+    small = z < 1e-6
+    root = np.sqrt(np.where(small, 1.0, z))
+    c = np.where(small, 1/2 - z/24, (1 - np.cos(root)) / np.where(small, 1.0, z))
+    s = np.where(small, 1/6 - z/120, (root - np.sin(root)) / root**3)
+    return c, s
+
+def kepler_drift(positions:np.ndarray, velocities:np.ndarray, mu:np.ndarray, dt:float, iterations:int=50) -> tuple[np.ndarray, np.ndarray]:
+    """Exact two body motion of bound pairs over dt
+
+    positions and velocities are relative (pairs, 2), mu = G(m_i + m_j). Universal variable formulation,
+    the universal anomaly of all pairs is found at once with laguerre-conway iteration"""
+    r0 = np.sqrt(np.sum(positions**2, axis=1))
+    sqrt_mu = np.sqrt(mu)
+    radial = np.sum(positions * velocities, axis=1) / sqrt_mu # r0 * radial velocity / sqrt(mu)
+    alpha = 2/r0 - np.sum(velocities**2, axis=1) / mu # inverse semi major axis
+    period = 2 * pi / (alpha**1.5 * sqrt_mu)
+    dt = np.fmod(np.full(len(mu), dt, dtype=np.float64), period) # whole orbits change nothing
+
+    chi = sqrt_mu * alpha * dt
+    for _ in range(iterations):
+        z = alpha * chi**2
+        c, s = stumpff(z)
+        f = radial * chi**2 * c + (1 - alpha*r0) * chi**3 * s + r0 * chi - sqrt_mu * dt
+        df = radial * chi * (1 - z*s) + (1 - alpha*r0) * chi**2 * c + r0
+        ddf = radial * (1 - z*c) + (1 - alpha*r0) * chi * (1 - z*s)
+        step = 5 * f / (df + np.sign(df) * np.sqrt(np.abs(16 * df**2 - 20 * f * ddf)))
+        chi -= step
+        if np.all(np.abs(step) <= 1e-14 * (1 + np.abs(chi))):
+            break
+
+    z = alpha * chi**2
+    c, s = stumpff(z)
+    f = 1 - chi**2 / r0 * c
+    g = dt - chi**3 * s / sqrt_mu
+    new_positions = f[:, np.newaxis] * positions + g[:, np.newaxis] * velocities
+    r = np.sqrt(np.sum(new_positions**2, axis=1))
+    df = sqrt_mu / (r * r0) * (alpha * chi**3 * s - chi)
+    dg = 1 - chi**2 / r * c
+    new_velocities = df[:, np.newaxis] * positions + dg[:, np.newaxis] * velocities
+    return new_positions, new_velocities
@@ -0,0 +1,87 @@
+import numpy as np
+
+class History:
+    """Preallocated circular buffer of positions and velocities
+
+    Every frame is written twice, at head and at head + capacity. That way the
+    frames from oldest to newest are always one contiguous slice of the buffer
+    and can be handed out as views without copying.
+    Room for balls doubles when full, so adding one does not copy every time"""
+    def __init__(self, capacity:int, positions:np.ndarray, velocities:np.ndarray):
+        self.capacity = max(1, int(capacity))
+        self.count = len(positions) # amount of balls
+        room = max(1, self.count)
+        self._pos = np.empty((2 * self.capacity, room, 2), dtype=positions.dtype)
+        self._vel = np.empty((2 * self.capacity, room, 2), dtype=velocities.dtype)
+        self.head = 0 # where the next frame is written
+        self.size = 0 # amount of valid frames
+        self.append(positions, velocities)
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f'<History {self.size}/{self.capacity} amt:{self.count}>'
+
+    @property
+    def start(self) -> int:
+        """Index of the oldest frame"""
+        return (self.head - self.size) % self.capacity
+
+    @property
+    def pos(self) -> np.ndarray:
+        """Positions from oldest to newest, shape (frames, balls, 2)"""
+        return self._pos[self.start:self.start + self.size, :self.count]
+
+    @property
+    def vel(self) -> np.ndarray:
+        """Velocities from oldest to newest, shape (frames, balls, 2)"""
+        return self._vel[self.start:self.start + self.size, :self.count]
+
+    def append(self, positions:np.ndarray, velocities:np.ndarray):
+        """Write newest frame, overwrites the oldest one when full"""
+        self._pos[self.head, :self.count] = positions
+        self._pos[self.head + self.capacity, :self.count] = positions
+        self._vel[self.head, :self.count] = velocities
+        self._vel[self.head + self.capacity, :self.count] = velocities
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def keep_last(self, amount:int):
+        """Forget everything but the newest amount of frames"""
+        self.size = min(self.size, max(0, amount))
+
+    def keep_first(self, amount:int):
+        """Forget everything but the oldest amount of frames"""
+        amount = min(self.size, max(0, amount))
+        self.head = (self.head - (self.size - amount)) % self.capacity
+        self.size = amount
+
+    def resize(self, capacity:int):
+        """Change the amount of frames, keeps the newest ones"""
+        frames_pos = self.pos[-capacity:].copy()
+        frames_vel = self.vel[-capacity:].copy()
+        self.capacity = max(1, int(capacity))
+        room = self._pos.shape[1]
+        self._pos = np.empty((2 * self.capacity, room, 2), dtype=self._pos.dtype)
+        self._vel = np.empty((2 * self.capacity, room, 2), dtype=self._vel.dtype)
+        self.head = 0
+        self.size = 0
+        for positions, velocities in zip(frames_pos, frames_vel):
+            self.append(positions, velocities)
+
+    def add_body(self, position:np.ndarray, velocity:np.ndarray):
+        """Append a ball that stood still at position with velocity for all stored frames"""
+        if self.count == self._pos.shape[1]:
+            room = 2 * self.count
+            self._pos = np.concatenate((self._pos, np.empty((len(self._pos), room - self.count, 2), dtype=self._pos.dtype)), axis=1)
+            self._vel = np.concatenate((self._vel, np.empty((len(self._vel), room - self.count, 2), dtype=self._vel.dtype)), axis=1)
+        self._pos[:, self.count] = position
+        self._vel[:, self.count] = velocity
+        self.count += 1
+
+    def remove_body(self, index:int):
+        """Remove a ball from all stored frames"""
+        self._pos[:, index:self.count - 1] = self._pos[:, index + 1:self.count]
+        self._vel[:, index:self.count - 1] = self._vel[:, index + 1:self.count]
+        self.count -= 1
@@ -0,0 +1,255 @@
+"""Compiled versions of the hot loops, used by PhysicsEngine(backend='numba')
+
+numba is optional, without it AVAILABLE is False and the engine stays on numpy.
+python -m scripts.kernels checks the compiled kernels against the numpy ones"""
+import argparse
+import sys
+import numpy as np
+from scripts.gravity import SPLINE_SCALE, softening_kernels
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+AVAILABLE = numba is not None
+
+if AVAILABLE:
+    # error_model='numpy' so coincident balls give inf like numpy instead of raising
+    jit = numba.njit(cache=True, error_model='numpy')
+    jit_parallel = numba.njit(cache=True, error_model='numpy', parallel=True)
+
+    @jit
+    def inverse_distance(distance_sq:float, softening:float, spline:bool) -> tuple[float, float]:
+        """Softened 1/r and 1/r³ of one pair, scalar version of gravity.inverse_distances"""
+        if softening <= 0:
+            inv_distance = 1 / np.sqrt(distance_sq)
+            return inv_distance, inv_distance**3
+        if not spline:
+            inv_distance = 1 / np.sqrt(distance_sq + softening*softening)
+            return inv_distance, inv_distance**3
+        h = SPLINE_SCALE * softening
+        u = np.sqrt(distance_sq) / h
+        if u < 0.5:
+            return (2.8 - u*u * (16/3 + u*u * (6.4*u - 9.6))) / h, (32/3 + u*u * (32*u - 38.4)) / h**3
+        if u < 1:
+            return (3.2 - 1/(15*u) - u*u * (32/3 + u * (-16 + u * (9.6 - 32/15*u)))) / h, (64/3 - 48*u + 38.4*u*u - 32/3*u**3 - 1/(15*u**3)) / h**3
+        inv_distance = 1 / np.sqrt(distance_sq)
+        return inv_distance, inv_distance**3
+
+    @jit_parallel
+    def accelerations(positions:np.ndarray, masses:np.ndarray, G:float, softening:float=0.0, spline:bool=False) -> np.ndarray:
+        """Direct summation, one fused loop per ball, no (N, N) temporaries"""
+        n = len(positions)
+        out = np.empty((n, 2))
+        for i in numba.prange(n):
+            x = positions[i, 0]
+            y = positions[i, 1]
+            ax = 0.0
+            ay = 0.0
+            for j in range(n):
+                if j == i:
+                    continue
+                dx = positions[j, 0] - x
+                dy = positions[j, 1] - y
+                distance_sq = dx*dx + dy*dy
+                if softening > 0:
+                    factor = masses[j] * inverse_distance(distance_sq, softening, spline)[1]
+                else:
+                    factor = masses[j] / (distance_sq * np.sqrt(distance_sq))
+                ax += dx * factor
+                ay += dy * factor
+            out[i, 0] = G * ax
+            out[i, 1] = G * ay
+        return out
+
+    @jit_parallel
+    def accelerations_potential(positions:np.ndarray, masses:np.ndarray, G:float, softening:float=0.0, spline:bool=False) -> tuple[np.ndarray, float]:
+        """Same as accelerations, also sums up the potential energy in the same pass"""
+        n = len(positions)
+        out = np.empty((n, 2))
+        total = 0.0
+        for i in numba.prange(n):
+            x = positions[i, 0]
+            y = positions[i, 1]
+            ax = 0.0
+            ay = 0.0
+            row = 0.0
+            for j in range(n):
+                if j == i:
+                    continue
+                dx = positions[j, 0] - x
+                dy = positions[j, 1] - y
+                distance_sq = dx*dx + dy*dy
+                inv_distance, inv_distance_cubed = inverse_distance(distance_sq, softening, spline)
+                row += masses[j] * inv_distance
+                factor = masses[j] * inv_distance_cubed
+                ax += dx * factor
+                ay += dy * factor
+            out[i, 0] = G * ax
+            out[i, 1] = G * ay
+            total += masses[i] * row
+        return out, -G * total / 2
+
+    @jit_parallel
+    def partial_accelerations(positions:np.ndarray, masses:np.ndarray, active:np.ndarray, G:float, softening:float=0.0, spline:bool=False) -> np.ndarray:
+        """Accelerations of the active balls only, caused by all balls"""
+        n = len(positions)
+        out = np.empty((len(active), 2))
+        for k in numba.prange(len(active)):
+            i = active[k]
+            x = positions[i, 0]
+            y = positions[i, 1]
+            ax = 0.0
+            ay = 0.0
+            for j in range(n):
+                if j == i:
+                    continue
+                dx = positions[j, 0] - x
+                dy = positions[j, 1] - y
+                distance_sq = dx*dx + dy*dy
+                if softening > 0:
+                    factor = masses[j] * inverse_distance(distance_sq, softening, spline)[1]
+                else:
+                    factor = masses[j] / (distance_sq * np.sqrt(distance_sq))
+                ax += dx * factor
+                ay += dy * factor
+            out[k, 0] = G * ax
+            out[k, 1] = G * ay
+        return out
+
+    @jit
+    def collisions(positions:np.ndarray, velocities:np.ndarray, radii:np.ndarray, masses:np.ndarray, dampening:float) -> bool:
+        """Sweep and prune plus elastic response in one pass, returns whether anything touched
+
+        All contacts are found on the old state first and applied together afterwards, same as the numpy version"""
+        n = len(positions)
+        if n < 2:
+            return False
+        spread_x = positions[:, 0].max() - positions[:, 0].min()
+        spread_y = positions[:, 1].max() - positions[:, 1].min()
+        axis = 0 if spread_x >= spread_y else 1
+        left = positions[:, axis] - radii
+        order = np.argsort(left)
+        shift = np.zeros((n, 2))
+        kick = np.zeros((n, 2))
+        touched = False
+
+        for a in range(n):
+            i = order[a]
+            right = left[i] + 2 * radii[i]
+            for b in range(a + 1, n):
+                j = order[b]
+                if left[j] >= right:
+                    break
+                dx = positions[i, 0] - positions[j, 0]
+                dy = positions[i, 1] - positions[j, 1]
+                distance = np.sqrt(dx*dx + dy*dy)
+                combined_radii = radii[i] + radii[j]
+                if not (0 < distance < combined_radii):
+                    continue
+                touched = True
+                dx /= distance
+                dy /= distance
+                overlap = combined_radii - distance
+                total_mass = masses[i] + masses[j]
+                shift[i, 0] += dx * overlap * masses[j] / total_mass
+                shift[i, 1] += dy * overlap * masses[j] / total_mass
+                shift[j, 0] -= dx * overlap * masses[i] / total_mass
+                shift[j, 1] -= dy * overlap * masses[i] / total_mass
+
+                v_proj = (velocities[j, 0] - velocities[i, 0]) * dx + (velocities[j, 1] - velocities[i, 1]) * dy
+                if v_proj > 0:
+                    impulse = 2 * v_proj / total_mass * dampening
+                    kick[i, 0] += dx * impulse * masses[j]
+                    kick[i, 1] += dy * impulse * masses[j]
+                    kick[j, 0] -= dx * impulse * masses[i]
+                    kick[j, 1] -= dy * impulse * masses[i]
+
+        if touched:
+            positions += shift
+            velocities += kick
+        return touched
+
+    @jit_parallel
+    def kinetic(velocities:np.ndarray, masses:np.ndarray) -> float:
+        total = 0.0
+        for i in numba.prange(len(velocities)):
+            total += 0.5 * masses[i] * (velocities[i, 0]**2 + velocities[i, 1]**2)
+        return total
+
+    @jit_parallel
+    def potential(positions:np.ndarray, masses:np.ndarray, G:float, softening:float=0.0, spline:bool=False) -> float:
+        """Sum over every pair once"""
+        n = len(positions)
+        total = 0.0
+        for i in numba.prange(n):
+            row = 0.0
+            for j in range(i + 1, n):
+                dx = positions[j, 0] - positions[i, 0]
+                dy = positions[j, 1] - positions[i, 1]
+                row += masses[j] * inverse_distance(dx*dx + dy*dy, softening, spline)[0]
+            total += masses[i] * row
+        return -G * total
+
+def parity(amount:int=200, seed:int=0, collisions:bool=True, softening:float=0.0, kernel:str='plummer') -> dict[str, float]:
+    """Largest relative difference between the numba and the numpy backend for every kernel"""
+    from scripts.physics import PhysicsEngine
+
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(0, 800, (amount, 2))
+    velocities = rng.normal(0, 1, (amount, 2))
+    radii = rng.uniform(2, 20, amount)
+    engines = {}
+    for backend in ('numpy', 'numba'):
+        engine = PhysicsEngine(0.03, collisions=collisions, backend=backend)
+        engine.softening, engine.softening_kernel = softening, kernel
+        engine.from_arrays(positions, velocities, radii, update=False)
+        engines[backend] = engine
+    reference, compiled = engines['numpy'], engines['numba']
+
+    def difference(a, b) -> float:
+        return float(np.max(np.abs(a - b) / np.maximum(np.abs(a), 1e-12), initial=0))
+
+    active = np.arange(0, amount, 3)
+    result = {
+        'accelerations': difference(reference.compute_accelerations(), compiled.compute_accelerations()),
+        'partial_accelerations': difference(reference.partial_accelerations(active), compiled.partial_accelerations(active)),
+        'kinetic': difference(reference.kinetic(), compiled.kinetic()),
+        'potential': difference(reference.potential(), compiled.potential()),
+    }
+    reference.fuse_potential = compiled.fuse_potential = True
+    reference.compute_accelerations()
+    compiled.compute_accelerations()
+    reference.fuse_potential = compiled.fuse_potential = False
+    result['fused potential'] = difference(reference.fused_potential[2], compiled.fused_potential[2])
+    reference.handle_collisions()
+    compiled.handle_collisions()
+    result['collisions'] = max(difference(reference.positions, compiled.positions), difference(reference.velocities, compiled.velocities))
+    reference.advance(100)
+    compiled.advance(100)
+    result['100 steps'] = difference(reference.positions, compiled.positions)
+    return result
+
+def main(argv:list[str]=None):
+    parser = argparse.ArgumentParser(prog='python -m scripts.kernels', description='Compare the numba backend against numpy')
+    parser.add_argument('--amount', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=1e-9, help='allowed relative difference')
+    parser.add_argument('--softening', type=float, default=0.0)
+    parser.add_argument('--kernel', default='plummer', choices=softening_kernels)
+    args = parser.parse_args(argv)
+
+    if not AVAILABLE:
+        print('numba is not installed, only the numpy backend is available')
+        sys.exit(1)
+
+    failed = False
+    for name, difference in parity(args.amount, args.seed, softening=args.softening, kernel=args.kernel).items():
+        ok = difference <= args.tolerance or name == '100 steps' # chaotic, only shown for reference
+        failed |= not ok
+        print(f'{name:>22}: {difference:.3e} {"ok" if ok else "MISMATCH"}')
+    sys.exit(failed)
+
+if __name__ == '__main__':
+    main()
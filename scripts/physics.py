@@ -1,87 +1,362 @@
 from __future__ import annotations
+from typing import TYPE_CHECKING
+from math import pi
 import numpy as np
-from scripts.const import Var
-from scripts.ui_elements import Ball
+from scripts.settings import Var
+from scripts.history import History
+from scripts.profiler import profiled, profiler
+from scripts import barnes_hut, gravity, kernels, scene
+
+if TYPE_CHECKING: # only for type hints, the engine itself runs without pygame
+    from scripts.ui_elements import Ball
+    from scripts.recording import Recorder
+
+YOSHIDA_WEIGHTS = (
+    1 / (2 - 2**(1/3)),
+    -2**(1/3) / (2 - 2**(1/3)),
+    1 / (2 - 2**(1/3)),
+)
+
+DORMAND_PRINCE_A = ( # runge-kutta matrix, the last row doubles as 5th order weights
+    (),
+    (1/5,),
+    (3/40, 9/40),
+    (44/45, -56/15, 32/9),
+    (19372/6561, -25360/2187, 64448/6561, -212/729),
+    (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+    (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84),
+)
+DORMAND_PRINCE_E = ( # 5th minus 4th order weights, used for the error estimate
+    35/384 - 5179/57600,
+    0,
+    500/1113 - 7571/16695,
+    125/192 - 393/640,
+    -2187/6784 + 92097/339200,
+    11/84 - 187/2100,
+    -1/40,
+)
+
+def _is_used_part(value, storage:np.ndarray, count:int) -> bool:
+    """True if value is exactly storage[:count], any other view of the storage still has to be copied"""
+    return isinstance(value, np.ndarray) and value.ctypes.data == storage.ctypes.data and value.dtype == storage.dtype \
+        and value.shape == storage[:count].shape and value.strides == storage.strides
 
 class PhysicsEngine:
-    def __init__(self, dt:float, method=None, collisions:bool=False, buffer:int=10, balls:list[Ball] | PhysicsEngine = None):
+    methods = ('euler', 'runge_kutta', 'verlet', 'yoshida', 'adaptive', 'block') # integrators, selectable as method by name + '_step'
+    force_methods = { # name: method, selectable as force_method
+        'direct':'compute_accelerations',
+        'tiled':'tiled_accelerations',
+        'symmetric':'symmetric_accelerations',
+        'barnes_hut':'barnes_hut_accelerations'
+    }
+
+    backends = ('numpy', 'numba') # numba needs the optional numba package, falls back to numpy without it
+
+    def __init__(self, dt:float, method=None, collisions:bool=False, buffer:int=10, balls:list[Ball] | PhysicsEngine = None, backend:str=None, dtype=None):
+        self.dtype = np.dtype(dtype or Var.dtype) # of positions, velocities, history and the pairwise terms, sums are always float64
+        self.backend = backend or Var.backend # runs forces, collisions and energies compiled with 'numba'
+        if self.backend == 'numba' and not kernels.AVAILABLE:
+            self.backend = 'numpy'
         self.buffer = buffer # size of buffer. half the buffer is for trajectory, the other for actual history. the "current" state is in the middle
         self.dt = dt
         self.collision_enabled = collisions
-
-        if method is None:
-            self.method = self.euler_step
+        self.theta = Var.theta # barnes-hut opening angle, 0 is exact
+        self.softening = Var.softening # plummer equivalent softening length, 0 is pure newton
+        self.softening_kernel = Var.softening_kernel # 'plummer' or 'spline'
+        self.regularize = Var.regularize # verlet and yoshida move tight bound pairs on exact kepler orbits
+        self.method = method or self.euler_step
+        self.force_method = self.compute_accelerations
+        self.scratch:np.ndarray = None # preallocated tiles for tiled_accelerations
+        self.acc:np.ndarray = None # accelerations of the current positions, carried over by verlet_step
+        self.tolerance = Var.tolerance # allowed local error of adaptive_step
+        self.adaptive_dt = dt # step size adaptive_step will try next
+        self.jerk:np.ndarray = None # change of acceleration over the last block_step, picks the rungs of the next one
+        self.fuse_potential = False # direct force methods also sum up the potential energy while they are at it
+        self.fused_potential:tuple = None # (positions, masses, potential) of the last fused force evaluation
+        self.recorder:Recorder = None # gets every displayed frame appended by update_physics
 
         if isinstance(balls, list):
-            if isinstance(balls[0], Ball):
-                self.from_balls(balls)
+            self.from_balls(balls, update=False)
 
         elif isinstance(balls, PhysicsEngine):
-            self.positions:np.ndarray = balls.positions.copy()
-            self.velocities:np.ndarray = balls.velocities.copy()
-            self.masses:np.ndarray = balls.masses.copy()
-            self.radii:np.ndarray = balls.radii.copy()
+            self.dtype = np.dtype(dtype or balls.dtype)
+            self.from_arrays(balls.positions, balls.velocities, balls.radii, balls.masses, update=False)
 
         else:
-            self.positions:np.ndarray = np.zeros((1,2),dtype=Var.dtype)
-            self.velocities:np.ndarray = np.zeros((1,2),dtype=Var.dtype)
-            self.masses:np.ndarray = np.ones((1,),dtype=Var.dtype)
-            self.radii:np.ndarray = np.ones((1,),dtype=Var.dtype)
+            self.from_arrays(np.zeros((1,2)), np.zeros((1,2)), np.ones(1), np.ones(1), update=False)
         
-        self.history_pos = self.positions[np.newaxis, :] # list of oldest to newest set of positions [t-3, t-2, t-1, t]
-        self.history_vel = self.velocities[np.newaxis, :]
+        self.history = History(self.buffer, self.positions, self.velocities) # oldest to newest set of positions [t-3, t-2, t-1, t]
         self.update_physics()
 
     def __repr__(self):
-        return f'<Phys amt:{len(self.positions)} buf:{len(self.history_pos)}>'
-    
+        return f'<Phys amt:{len(self.positions)} buf:{len(self.history)} {self.backend} {self.dtype}>'
+
+    # the state lives in arrays with spare room at the end, these are views of the used part.
+    # assigning copies into the storage, unless it is that very view (e.g. after +=)
+
+    @property
+    def positions(self) -> np.ndarray:
+        return self._positions[:self.count]
+
+    @positions.setter
+    def positions(self, value:np.ndarray):
+        if not _is_used_part(value, self._positions, self.count):
+            self._positions[:self.count] = value
+
+    @property
+    def velocities(self) -> np.ndarray:
+        return self._velocities[:self.count]
+
+    @velocities.setter
+    def velocities(self, value:np.ndarray):
+        if not _is_used_part(value, self._velocities, self.count):
+            self._velocities[:self.count] = value
+
+    @property
+    def masses(self) -> np.ndarray:
+        return self._masses[:self.count]
+
+    @masses.setter
+    def masses(self, value:np.ndarray):
+        if not _is_used_part(value, self._masses, self.count):
+            self._masses[:self.count] = value
+
+    @property
+    def radii(self) -> np.ndarray:
+        return self._radii[:self.count]
+
+    @radii.setter
+    def radii(self, value:np.ndarray):
+        if not _is_used_part(value, self._radii, self.count):
+            self._radii[:self.count] = value
+
+    @property
+    def history_pos(self) -> np.ndarray:
+        """Ordered view of position history, shape (frames, balls, 2)"""
+        return self.history.pos
+
+    @property
+    def history_vel(self) -> np.ndarray:
+        """Ordered view of velocity history, shape (frames, balls, 2)"""
+        return self.history.vel
+
+    @property
+    def current(self) -> int:
+        """Index of the displayed frame in the history, everything after it is prediction"""
+        return max(0, len(self.history) - self.buffer//2)
+
+    def reserve(self, capacity:int):
+        """Make room for at least capacity balls, grows by doubling"""
+        if capacity <= len(self._masses):
+            return
+        capacity = max(capacity, 2 * len(self._masses))
+        for name in ('_positions', '_velocities', '_masses', '_radii'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
     def add_ball(self, ball:Ball):
-        """Add ball to engine"""
-        index = max(0, len(self.history_pos) - self.buffer // 2)
-        history_slice = slice(index, None)
-        self.positions = np.vstack((self.positions, ball.pos))
-        self.velocities = np.vstack((self.velocities, ball.vel))
-        self.masses = np.append(self.masses, ball.mass)
-        self.radii = np.append(self.radii, ball.radius)
-        time_steps = len(self.history_pos[history_slice])
-        old_ball_count = self.history_pos.shape[1]
-        new_ball_history = np.tile(ball.pos, (time_steps, 1))
-        new_ball_vel_history = np.tile(ball.vel, (time_steps, 1))
-        new_history_pos = np.zeros((time_steps, old_ball_count + 1, 2), dtype=self.history_pos.dtype)
-        new_history_vel = np.zeros((time_steps, old_ball_count + 1, 2), dtype=self.history_vel.dtype)
-        new_history_pos[:, :-1, :] = self.history_pos[history_slice]
-        new_history_vel[:, :-1, :] = self.history_vel[history_slice]
-        new_history_pos[:, -1, :] = new_ball_history
-        new_history_vel[:, -1, :] = new_ball_vel_history
-        self.history_pos = new_history_pos
-        self.history_vel = new_history_vel
-        self.update_physics()
+        """Add ball to engine at the displayed frame, only the prediction gets simulated again"""
+        self.reserve(self.count + 1)
+        self.count += 1
+        self.history.add_body(ball.pos, ball.vel)
+        self.update_ball(self.count - 1, ball)
 
     def remove_ball(self, index:int):
-        """Remove ball from engine"""
-        self.positions = np.delete(self.positions, index, axis=0)
-        self.velocities = np.delete(self.velocities, index, axis=0)
-        self.masses = np.delete(self.masses, index)
-        self.radii = np.delete(self.radii, index)
-        self.history_pos = np.delete(self.history_pos, index, axis=1)
-        self.history_vel = np.delete(self.history_vel, index, axis=1)
-        self.update_physics()
+        """Remove ball from engine, only the prediction gets simulated again"""
+        for array in (self._positions, self._velocities, self._masses, self._radii):
+            array[index:self.count - 1] = array[index + 1:self.count]
+        self.count -= 1
+        self.history.remove_body(index)
+        self.repredict()
 
+    def update_ball(self, index:int, ball:Ball):
+        """Apply position/velocity/radius of one ball to the displayed frame, only the prediction gets simulated again"""
+        self.repredict(index, ball)
+
+    def set_buffer(self, buffer:int):
+        """Change the length of the history, keeps the displayed frame and the past"""
+        self.history.keep_first(self.current + 1)
+        self.buffer = buffer
+        self.history.resize(buffer)
+        self.repredict(current=len(self.history) - 1)
+
+    def repredict(self, index:int=None, ball:Ball=None, current:int=None):
+        """Throw away the prediction half of the history and simulate it again from the displayed frame
+
+        Call after changing dt, method, collisions etc. Optionally one ball gets changed first"""
+        current = self.current if current is None else current
+        self.positions = self.history_pos[current]
+        self.velocities = self.history_vel[current]
+        if ball is not None:
+            self.positions[index] = ball.pos
+            self.velocities[index] = ball.vel
+            self.radii[index] = ball.radius
+            self.masses[index] = ball.mass
+
+        self.history.keep_first(current)
+        self.history.keep_last(self.buffer - self.buffer//2) # room for the prediction
+        self.history.append(self.positions, self.velocities)
+        self.acc = None
+        self.jerk = None
+        for _ in range(self.buffer//2 - 1):
+            self.advance(Var.steps_per_draw)
+            self.history.append(self.positions, self.velocities)
+
+    @property
+    def kernel_softening(self) -> tuple[float, bool]:
+        """Softening arguments of the numba kernels"""
+        return float(self.softening), self.softening_kernel == 'spline'
+
+    def remember_potential(self, potential:float):
+        """Keep a potential energy computed along with the forces, potential() returns it while nothing moved"""
+        self.fused_potential = self.positions.copy(), self.masses.copy(), potential
+
+    @profiled('forces')
     def compute_accelerations(self):
         """Calculates accelerations"""
+        if self.backend == 'numba':
+            if not self.fuse_potential:
+                return kernels.accelerations(self.positions, self.masses, Var.G, *self.kernel_softening)
+            accelerations, potential = kernels.accelerations_potential(self.positions, self.masses, Var.G, *self.kernel_softening)
+            self.remember_potential(potential)
+            return accelerations
         diff = self.positions[:, np.newaxis, :] - self.positions[np.newaxis, :, :]
         distances_sq = np.sum(diff**2, axis=2)
         np.fill_diagonal(distances_sq, 1.0)
-        inv_distances_cubed = (1/np.sqrt(distances_sq))**3
+        inv_distances, inv_distances_cubed = gravity.inverse_distances(distances_sq, self.softening, self.softening_kernel)
         np.fill_diagonal(inv_distances_cubed, 0.0)
         masses_matrix = self.masses[:, np.newaxis] * self.masses[np.newaxis, :]
+        if self.fuse_potential:
+            np.fill_diagonal(inv_distances, 0.0)
+            self.remember_potential(-Var.G * np.sum(masses_matrix * inv_distances, dtype=np.float64) / 2.0)
         forces = -Var.G * masses_matrix[..., np.newaxis] * diff * inv_distances_cubed[..., np.newaxis]
-        accelerations = np.sum(forces, axis=1) / self.masses[:, np.newaxis]
+        accelerations = np.sum(forces, axis=1, dtype=np.float64) / self.masses[:, np.newaxis]
+        return accelerations
+
+    @profiled('forces')
+    def partial_accelerations(self, active:np.ndarray):
+        """Calculates accelerations of the active balls only, caused by all balls"""
+        if self.backend == 'numba':
+            return kernels.partial_accelerations(self.positions, self.masses, active, Var.G, *self.kernel_softening)
+        diff = self.positions[np.newaxis, :, :] - self.positions[active, np.newaxis, :]
+        distances_sq = np.sum(diff**2, axis=2)
+        distances_sq[np.arange(len(active)), active] = np.inf
+        _, inv_distances_cubed = gravity.inverse_distances(distances_sq, self.softening, self.softening_kernel)
+        return Var.G * np.einsum('ij,ijk->ik', inv_distances_cubed * self.masses, diff, dtype=np.float64)
+
+    @profiled('forces')
+    def tiled_accelerations(self):
+        """Calculates accelerations by direct summation in square tiles
+
+        Only a few tile sized scratch buffers are used, so memory grows with N instead of N²"""
+        n = len(self.positions)
+        tile = max(1, min(Var.tile_size, n))
+        if self.scratch is None or self.scratch.shape[1] < tile or self.scratch.dtype != self.dtype:
+            self.scratch = np.empty((4, tile, tile), dtype=self.dtype)
+
+        x = self.positions[:, 0]
+        y = self.positions[:, 1]
+        accelerations = np.zeros((n, 2), dtype=np.float64)
+        potential = 0.0
+
+        for row in range(0, n, tile):
+            rows = slice(row, min(row + tile, n))
+            for col in range(0, n, tile):
+                cols = slice(col, min(col + tile, n))
+                shape = (rows.stop - rows.start, cols.stop - cols.start)
+                dx, dy, inv_distances_cubed, tmp = (buf[:shape[0], :shape[1]] for buf in self.scratch)
+
+                np.subtract(x[np.newaxis, cols], x[rows, np.newaxis], out=dx)
+                np.subtract(y[np.newaxis, cols], y[rows, np.newaxis], out=dy)
+                np.multiply(dx, dx, out=inv_distances_cubed)
+                np.multiply(dy, dy, out=tmp)
+                inv_distances_cubed += tmp
+                if row == col:
+                    np.fill_diagonal(inv_distances_cubed, 1.0)
+                if self.softening > 0: # allocates, the in place chain is for plain newton only
+                    inv_distances, softened_cubed = gravity.inverse_distances(inv_distances_cubed, self.softening, self.softening_kernel)
+                    inv_distances_cubed[:] = inv_distances
+                else:
+                    np.sqrt(inv_distances_cubed, out=inv_distances_cubed)
+                    np.divide(1, inv_distances_cubed, out=inv_distances_cubed)
+                if self.fuse_potential:
+                    np.multiply(inv_distances_cubed, self.masses[np.newaxis, cols], out=tmp)
+                    if row == col:
+                        np.fill_diagonal(tmp, 0.0)
+                    potential += self.masses[rows] @ tmp.sum(axis=1, dtype=np.float64)
+                if self.softening > 0:
+                    inv_distances_cubed[:] = softened_cubed
+                else:
+                    np.power(inv_distances_cubed, 3, out=inv_distances_cubed)
+                if row == col:
+                    np.fill_diagonal(inv_distances_cubed, 0.0)
+                inv_distances_cubed *= self.masses[np.newaxis, cols]
+
+                np.multiply(dx, inv_distances_cubed, out=tmp)
+                accelerations[rows, 0] += tmp.sum(axis=1, dtype=np.float64)
+                np.multiply(dy, inv_distances_cubed, out=tmp)
+                accelerations[rows, 1] += tmp.sum(axis=1, dtype=np.float64)
+
+        accelerations *= Var.G
+        if self.fuse_potential:
+            self.remember_potential(-Var.G * potential / 2.0)
+        return accelerations
+
+    @profiled('forces')
+    def symmetric_accelerations(self):
+        """Calculates accelerations from every pair only once, in square tiles of the upper triangle
+
+        A tile adds G·m_j·d/r³ to the balls of its rows and takes G·m_i·d/r³ from the balls of its columns
+        (newton's third law), so half the pairs get computed and no force gets divided by a mass again.
+        The numba backend has no use for this and computes all pairs directly"""
+        if self.backend == 'numba':
+            return self.compute_accelerations()
+        n = len(self.positions)
+        tile = max(1, min(Var.tile_size, n))
+        lower = np.tri(tile, dtype=bool) # pairs a tile on the diagonal would count twice, or with itself
+        x = self.positions[:, 0]
+        y = self.positions[:, 1]
+        masses = self.masses
+        accelerations = np.zeros((n, 2), dtype=np.float64)
+        potential = 0.0
+
+        for row in range(0, n, tile):
+            rows = slice(row, min(row + tile, n))
+            for col in range(row, n, tile):
+                cols = slice(col, min(col + tile, n))
+                dx = x[np.newaxis, cols] - x[rows, np.newaxis]
+                dy = y[np.newaxis, cols] - y[rows, np.newaxis]
+                distances_sq = dx*dx + dy*dy
+                if row == col:
+                    size = rows.stop - rows.start
+                    distances_sq[lower[:size, :size]] = np.inf
+                inv_distances, inv_distances_cubed = gravity.inverse_distances(distances_sq, self.softening, self.softening_kernel)
+                dx *= inv_distances_cubed
+                dy *= inv_distances_cubed
+                accelerations[rows, 0] += dx @ masses[cols]
+                accelerations[rows, 1] += dy @ masses[cols]
+                accelerations[cols, 0] -= masses[rows] @ dx
+                accelerations[cols, 1] -= masses[rows] @ dy
+                if self.fuse_potential:
+                    potential += masses[rows] @ inv_distances @ masses[cols]
+
+        accelerations *= Var.G
+        if self.fuse_potential:
+            self.remember_potential(-Var.G * potential)
         return accelerations
 
+    @profiled('forces')
+    def barnes_hut_accelerations(self):
+        """Approximates accelerations in O(N log N) with a quadtree, falls back to direct summation for few balls"""
+        if len(self.positions) < Var.barnes_hut_min:
+            return self.compute_accelerations()
+        return barnes_hut.accelerations(self.positions, self.masses, self.theta, Var.G, self.softening, self.softening_kernel)
+
     def euler_step(self, dt:float):
         """Euler step with collision check"""
-        accelerations = self.compute_accelerations()
+        accelerations = self.force_method()
         self.velocities += accelerations * dt
         self.positions += self.velocities * dt
     
@@ -90,110 +365,383 @@ class PhysicsEngine:
         orig_pos = self.positions.copy()
         orig_vel = self.velocities.copy()
         
-        k1_acc = self.compute_accelerations()
+        k1_acc = self.force_method()
         k1_vel = self.velocities.copy()
         
         self.positions = orig_pos + k1_vel * (dt * 0.5)
         self.velocities = orig_vel + k1_acc * (dt * 0.5)
-        k2_acc = self.compute_accelerations()
+        k2_acc = self.force_method()
         k2_vel = self.velocities.copy()
         
         self.positions = orig_pos + k2_vel * (dt * 0.5)
         self.velocities = orig_vel + k2_acc * (dt * 0.5)
-        k3_acc = self.compute_accelerations()
+        k3_acc = self.force_method()
         k3_vel = self.velocities.copy()
         
         self.positions = orig_pos + k3_vel * dt
         self.velocities = orig_vel + k3_acc * dt
-        k4_acc = self.compute_accelerations()
+        k4_acc = self.force_method()
         k4_vel = self.velocities.copy()
         
         self.positions = orig_pos + (dt/6.0) * (k1_vel + 2*k2_vel + 2*k3_vel + k4_vel)
         self.velocities = orig_vel + (dt/6.0) * (k1_acc + 2*k2_acc + 2*k3_acc + k4_acc)
 
+    def collision_pairs(self, radii:np.ndarray=None):
+        """Broad phase: sweep and prune along the wider axis
+
+        Returns index arrays i, j of every pair whose bounding intervals overlap, radii defaults to the ball radii"""
+        radii = self.radii if radii is None else radii
+        n = len(self.positions)
+        axis = int(np.argmax(np.ptp(self.positions, axis=0))) if n else 0
+        left = self.positions[:, axis] - radii
+        order = np.argsort(left, kind='stable')
+        left = left[order]
+        right = left + 2 * radii[order]
+        ends = np.searchsorted(left, right, 'left') # every sorted ball overlaps with the ones up to its end
+        amount = np.maximum(ends - np.arange(n) - 1, 0)
+        first = np.repeat(np.arange(n), amount)
+        offsets = np.arange(amount.sum()) - np.repeat(np.cumsum(amount) - amount, amount)
+        return order[first], order[first + 1 + offsets]
+
+    def regularized_pairs(self) -> tuple[np.ndarray, np.ndarray]:
+        """Bound pairs closer than Var.regularize_distance, closest first and every ball in one pair at most
+
+        The kepler drift is plain newton, so with softening only pairs whose whole orbit stays where the
+        kernel is newton qualify. That is outside the spline support, plummer never is"""
+        newton = gravity.newton_distance(self.softening, self.softening_kernel)
+        if newton == np.inf:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        reach = np.full(len(self.positions), Var.regularize_distance / 2)
+        i, j = self.collision_pairs(reach)
+        diff = self.positions[j] - self.positions[i]
+        distances = np.sqrt(np.sum(diff**2, axis=1, dtype=np.float64))
+        relative_vel = self.velocities[j] - self.velocities[i]
+        speeds_sq = np.sum(relative_vel**2, axis=1, dtype=np.float64)
+        mu = Var.G * (self.masses[i] + self.masses[j])
+        bound = (distances < Var.regularize_distance) & (speeds_sq / 2 < mu / distances)
+        if newton:
+            bound[bound] = gravity.periapsis(diff[bound], relative_vel[bound], mu[bound]) >= newton
+        order = np.argsort(distances[bound], kind='stable')
+        i, j = i[bound][order], j[bound][order]
+
+        taken = set()
+        keep = []
+        for index, (a, b) in enumerate(zip(i.tolist(), j.tolist())):
+            if a not in taken and b not in taken:
+                taken.update((a, b))
+                keep.append(index)
+        return i[keep], j[keep]
+
+    def pair_accelerations(self, i:np.ndarray, j:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Plain newton accelerations the balls of each pair cause on each other, the part the kepler drift takes over"""
+        diff = self.positions[j] - self.positions[i]
+        inv_distances_cubed = np.sum(diff**2, axis=1) ** -1.5
+        return Var.G * (self.masses[j] * inv_distances_cubed)[:, np.newaxis] * diff, -Var.G * (self.masses[i] * inv_distances_cubed)[:, np.newaxis] * diff
+
+    def kick(self, dt:float, pairs:tuple[np.ndarray, np.ndarray]):
+        """Velocities += acceleration * dt, without the forces inside the regularized pairs"""
+        self.velocities += self.acc * dt
+        if len(pairs[0]):
+            acc_i, acc_j = self.pair_accelerations(*pairs)
+            self.velocities[pairs[0]] -= acc_i * dt
+            self.velocities[pairs[1]] -= acc_j * dt
+
+    def drift(self, dt:float, pairs:tuple[np.ndarray, np.ndarray]):
+        """Straight lines, the regularized pairs orbit their center of mass on exact kepler orbits instead"""
+        i, j = pairs
+        relative_pos = self.positions[j] - self.positions[i]
+        relative_vel = self.velocities[j] - self.velocities[i]
+        self.positions += self.velocities * dt
+        if not len(i):
+            return
+        mass_i, mass_j = self.masses[i][:, np.newaxis], self.masses[j][:, np.newaxis]
+        total = mass_i + mass_j
+        center = (mass_i * self.positions[i] + mass_j * self.positions[j]) / total
+        center_velocity = (mass_i * self.velocities[i] + mass_j * self.velocities[j]) / total
+        relative_pos, relative_vel = gravity.kepler_drift(relative_pos, relative_vel, Var.G * total[:, 0], dt)
+        self.positions[i] = center - mass_j / total * relative_pos
+        self.positions[j] = center + mass_i / total * relative_pos
+        self.velocities[i] = center_velocity - mass_j / total * relative_vel
+        self.velocities[j] = center_velocity + mass_i / total * relative_vel
+
+    def verlet_step(self, dt:float):
+        """Velocity verlet (kick drift kick) step, needs one force evaluation by reusing the last acceleration
+
+        With regularize on, tight bound pairs drift along their exact two body orbit and only feel the rest as kicks"""
+        if self.acc is None or len(self.acc) != len(self.positions):
+            self.acc = self.force_method()
+        if not self.regularize:
+            self.velocities += self.acc * (dt * 0.5)
+            self.positions += self.velocities * dt
+            self.acc = self.force_method()
+            self.velocities += self.acc * (dt * 0.5)
+            return
+
+        pairs = self.regularized_pairs()
+        self.kick(dt * 0.5, pairs)
+        self.drift(dt, pairs)
+        self.acc = self.force_method()
+        self.kick(dt * 0.5, pairs)
+
+    def yoshida_step(self, dt:float):
+        """Yoshida 4th order step, composed of three verlet steps"""
+        for weight in YOSHIDA_WEIGHTS:
+            self.verlet_step(dt * weight)
+
+    def adaptive_step(self, dt:float):
+        """Dormand-Prince 5(4) with error control, advances exactly dt in as many steps as the tolerance needs"""
+        remaining = dt
+        while remaining > 0:
+            h = min(self.adaptive_dt, remaining)
+            clipped = h < self.adaptive_dt
+            orig_pos = self.positions.copy()
+            orig_vel = self.velocities.copy()
+            if self.acc is None or len(self.acc) != len(self.positions):
+                self.acc = self.force_method()
+
+            k_pos = [orig_vel]
+            k_vel = [self.acc]
+            for row in DORMAND_PRINCE_A[1:]:
+                self.positions = orig_pos + h * sum(a * k for a, k in zip(row, k_pos))
+                self.velocities = orig_vel + h * sum(a * k for a, k in zip(row, k_vel))
+                k_pos.append(self.velocities.copy())
+                k_vel.append(self.force_method())
+
+            err_pos = h * sum(e * k for e, k in zip(DORMAND_PRINCE_E, k_pos))
+            err_vel = h * sum(e * k for e, k in zip(DORMAND_PRINCE_E, k_vel))
+            scale_pos = self.tolerance * (1 + np.maximum(np.abs(orig_pos), np.abs(self.positions)))
+            scale_vel = self.tolerance * (1 + np.maximum(np.abs(orig_vel), np.abs(self.velocities)))
+            err = max(np.max(np.abs(err_pos) / scale_pos, initial=0), np.max(np.abs(err_vel) / scale_vel, initial=0))
+            factor = min(5.0, max(0.2, 0.9 * err**-0.2)) if err > 0 else 5.0
+
+            if err <= 1 or h <= dt * 1e-9: # accepted, the last stage is evaluated at the new state
+                self.acc = k_vel[-1]
+                remaining -= h
+                self.handle_collisions()
+                if not clipped:
+                    self.adaptive_dt = h * factor
+            else:
+                self.positions = orig_pos
+                self.velocities = orig_vel
+                self.adaptive_dt = h * factor
+
+    def block_step(self, dt:float):
+        """Block timestep leapfrog, every ball moves on its own power of two fraction of dt
+
+        The rung of a ball is picked from how fast its acceleration changed during the last block.
+        Only balls that finish their own step get new forces, after dt all are in sync again"""
+        n = len(self.positions)
+        if self.acc is None or len(self.acc) != n:
+            self.acc = self.force_method()
+
+        if self.jerk is None or len(self.jerk) != n: # no previous step to compare against, start on the finest rung
+            rungs = np.full(n, Var.block_max_rung, dtype=np.int64)
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                wanted = Var.block_eta * np.sqrt(np.sum(self.acc**2, axis=1) / np.sum(self.jerk**2, axis=1))
+                rungs = np.clip(np.nan_to_num(np.ceil(np.log2(dt / wanted)), nan=0), 0, Var.block_max_rung).astype(np.int64)
+        start_acc = self.acc.copy()
+        levels = int(rungs.max(initial=0))
+        substeps = 1 << levels
+        period = 1 << (levels - rungs) # amount of substeps per own step
+        own_dt = dt / (1 << rungs)
+        h = dt / substeps
+
+        self.velocities += self.acc * (own_dt * 0.5)[:, np.newaxis]
+        for substep in range(1, substeps + 1):
+            self.positions += self.velocities * h
+            active = np.flatnonzero(substep % period == 0)
+            if len(active) == n:
+                self.acc = self.force_method()
+            else:
+                self.acc[active] = self.partial_accelerations(active)
+            kick = own_dt[active] * (0.5 if substep == substeps else 1.0) # closing half kick on the last substep
+            self.velocities[active] += self.acc[active] * kick[:, np.newaxis]
+
+        self.jerk = (self.acc - start_acc) / dt
+
+    @profiled('collisions')
     def handle_collisions(self):
-        """Handles collisions between balls as perfect elastic collision"""
+        """Handles collisions between balls as perfect elastic collision
+
+        Candidate pairs come from collision_pairs, all contacts are then resolved at once"""
         if not self.collision_enabled: return
-        diff = self.positions[:, np.newaxis, :] - self.positions[np.newaxis, :, :]
-        distances:np.ndarray = np.linalg.norm(diff, axis=-1)
-        combined_radii = self.radii[:, np.newaxis] + self.radii[np.newaxis, :]
-        
-        for i, j in np.argwhere(np.triu(distances < combined_radii,1)):
-            direction = diff[i, j] / distances[i, j]
-            overlap = combined_radii[i, j] - distances[i, j]
-            ratio_i = self.masses[j] / (self.masses[i] + self.masses[j])
-            ratio_j = self.masses[i] / (self.masses[i] + self.masses[j])
-            self.positions[i] += (direction * overlap * ratio_i)
-            self.positions[j] -= (direction * overlap * ratio_j)
-            rel_vel = self.velocities[j] - self.velocities[i]
-            v_proj = np.dot(rel_vel, direction)
-            
-            if 0 < v_proj:
-                impulse = 2 * v_proj / (self.masses[i] + self.masses[j])
-                self.velocities[i] += direction * (impulse * self.masses[j]) * Var.dampening
-                self.velocities[j] += -direction * (impulse * self.masses[i]) * Var.dampening
+        if self.backend == 'numba':
+            if kernels.collisions(self.positions, self.velocities, self.radii, self.masses, Var.dampening):
+                self.acc = None
+            return
+        i, j = self.collision_pairs()
+        diff = self.positions[i] - self.positions[j]
+        distances = np.sqrt(np.sum(diff**2, axis=1))
+        combined_radii = self.radii[i] + self.radii[j]
+        contact = (distances < combined_radii) & (distances > 0)
+        if not contact.any(): return
+        self.acc = None
+
+        i, j = i[contact], j[contact]
+        distances = distances[contact]
+        direction = diff[contact] / distances[:, np.newaxis]
+        overlap = combined_radii[contact] - distances
+        total_mass = self.masses[i] + self.masses[j]
+        ratio_i = self.masses[j] / total_mass
+        ratio_j = self.masses[i] / total_mass
+        np.add.at(self.positions, i, direction * (overlap * ratio_i)[:, np.newaxis])
+        np.add.at(self.positions, j, -direction * (overlap * ratio_j)[:, np.newaxis])
+
+        rel_vel = self.velocities[j] - self.velocities[i]
+        v_proj = np.sum(rel_vel * direction, axis=1)
+        impulse = np.where(0 < v_proj, 2 * v_proj / total_mass, 0.0) * Var.dampening
+        np.add.at(self.velocities, i, direction * (impulse * self.masses[j])[:, np.newaxis])
+        np.add.at(self.velocities, j, -direction * (impulse * self.masses[i])[:, np.newaxis])
    
-    def update_physics(self, steps=Var.steps_per_draw, dt:float=None, method:function=None, collision:bool=None):
-        """Update physics"""
-        def step():
-            for _ in range(steps):
+    @profiled('integration')
+    def advance(self, steps:int):
+        """Integrate steps * dt into the future without touching the history"""
+        if self.method == self.adaptive_step: # picks its own step sizes, only the end is fixed
+            self.adaptive_step(self.dt * steps)
+        else:
+            # these end on a force evaluation at the final positions, so the potential energy comes for free
+            fuse = getattr(self.method, '__name__', '') in ('verlet_step', 'yoshida_step', 'block_step')
+            for step in range(steps):
+                self.fuse_potential = fuse and step == steps - 1
                 self.method(self.dt)
                 self.handle_collisions()
-            
-            self.history_pos = np.concatenate((self.history_pos, [self.positions]))
-            self.history_vel = np.concatenate((self.history_vel, [self.velocities]))
+            self.fuse_potential = False
+
+    def update_physics(self, steps=Var.steps_per_draw, dt:float=None, method:function=None, collision:bool=None, force_method:function=None):
+        """Update physics"""
+        def step():
+            self.advance(steps)
+            with profiler.phase('history'):
+                self.history.append(self.positions, self.velocities)
 
         if dt:
             self.dt = float(dt)
         if method:
             self.method = method
+            self.acc = None
+        if force_method:
+            self.force_method = force_method
+            self.acc = None
         if collision:
             self.collision_enabled = bool(collision)
 
         step()
         
-        while len(self.history_pos) < self.buffer//2:
+        while len(self.history) < self.buffer//2:
             step()
-        
-        self.history_pos = self.history_pos[-self.buffer:]
-        self.history_vel = self.history_vel[-self.buffer:]
-
-    def update_balls(self, balls:list[Ball]):
-        """Update existing balls position and velicoty"""
-        index = max(0, len(self.history_pos) - self.buffer//2)
-        for i, ball in enumerate(balls):
-            ball.pos = self.history_pos[index][i]
-            ball.vel = self.history_vel[index][i]
-    
-    def from_balls(self, balls:list[Ball]):
+
+        if self.recorder is not None:
+            self.recorder.append(self.history_pos[self.current], self.history_vel[self.current])
+
+    def from_balls(self, balls:list[Ball], update:bool=True):
         """Apply position/velocity/etc from list of balls"""
-        n = len(balls)
-        self.positions = np.zeros((n, 2), dtype=np.float64)
-        self.velocities = np.zeros((n, 2), dtype=np.float64)
-        self.masses = np.zeros(n, dtype=np.float64)
-        self.radii = np.zeros(n, dtype=np.float64)
-
-        for i, ball in enumerate(balls):
-            self.positions[i] = ball.pos
-            self.velocities[i] = ball.vel
-            self.masses[i] = ball.mass
-            self.radii[i] = ball.radius
-
-        self.history_pos = self.positions[np.newaxis,:]
-        self.history_vel = self.velocities[np.newaxis,:]
-        self.update_physics()
+        self.from_arrays(
+            np.array([ball.pos for ball in balls], dtype=self.dtype),
+            np.array([ball.vel for ball in balls], dtype=self.dtype),
+            np.array([ball.radius for ball in balls], dtype=self.dtype),
+            np.array([ball.mass for ball in balls], dtype=self.dtype),
+            update,
+        )
+
+    def from_arrays(self, positions:np.ndarray, velocities:np.ndarray, radii:np.ndarray, masses:np.ndarray=None, update:bool=True):
+        """Apply positions, velocities, radii and masses, masses default to the area of the ball
+
+        With update the prediction half of the history gets simulated right away"""
+        self.count = len(positions)
+        self._positions = np.array(np.reshape(positions, (-1, 2)), dtype=self.dtype) # owning, not a view of a temporary
+        self._velocities = np.array(np.reshape(velocities, (-1, 2)), dtype=self.dtype)
+        self._radii = np.array(radii, dtype=self.dtype)
+        self._masses = pi * self._radii**2 if masses is None else np.array(masses, dtype=self.dtype)
+
+        self.acc = None
+        self.jerk = None
+        self.history = History(self.buffer, self.positions, self.velocities)
+        if update:
+            self.update_physics()
+
+    def from_scene(self, path:str, update:bool=True):
+        """Apply a scene file (.scene, .npz or .csv) in bulk, see scripts/scene.py"""
+        self.from_arrays(*scene.load(path), update=update)
+
+    def state(self) -> dict[str, np.ndarray]:
+        """Copy of everything needed to continue exactly from here, see load_state
+
+        Only copies, so it is quick and the arrays can be written out on another thread"""
+        optional = {name: getattr(self, name).copy() for name in ('acc', 'jerk') if getattr(self, name) is not None}
+        return {
+            'positions': self.positions.copy(),
+            'velocities': self.velocities.copy(),
+            'radii': self.radii.copy(),
+            'masses': self.masses.copy(),
+            'history_pos': self.history_pos.copy(),
+            'history_vel': self.history_vel.copy(),
+            'dt': np.float64(self.dt),
+            'adaptive_dt': np.float64(self.adaptive_dt),
+            'buffer': np.int64(self.buffer),
+            'method': np.str_(self.method.__name__),
+            'force_method': np.str_(self.force_method.__name__),
+            'collisions': np.bool_(self.collision_enabled),
+            'backend': np.str_(self.backend),
+            'theta': np.float64(self.theta),
+            'tolerance': np.float64(self.tolerance),
+            'softening': np.float64(self.softening),
+            'softening_kernel': np.str_(self.softening_kernel),
+            'regularize': np.bool_(self.regularize),
+            **optional,
+        }
+
+    def load_state(self, state:dict[str, np.ndarray]):
+        """Continue from a state, the history is taken over as it is so nothing gets simulated again"""
+        self.dtype = state['positions'].dtype
+        self.count = len(state['positions'])
+        self._positions = np.array(state['positions'])
+        self._velocities = np.array(state['velocities'])
+        self._radii = np.array(state['radii'])
+        self._masses = np.array(state['masses'])
+        self.dt = float(state['dt'])
+        self.adaptive_dt = float(state['adaptive_dt'])
+        self.buffer = int(state['buffer'])
+        self.method = getattr(self, str(state['method']))
+        self.force_method = getattr(self, str(state['force_method']))
+        self.collision_enabled = bool(state['collisions'])
+        self.backend = str(state['backend']) if kernels.AVAILABLE else 'numpy'
+        self.theta = float(state['theta'])
+        self.tolerance = float(state['tolerance'])
+        self.softening = float(state['softening'])
+        self.softening_kernel = str(state['softening_kernel'])
+        self.regularize = bool(state['regularize'])
+        self.acc = np.array(state['acc']) if 'acc' in state else None
+        self.jerk = np.array(state['jerk']) if 'jerk' in state else None
+        self.fused_potential = None
+        self.scratch = None
+
+        frames_pos, frames_vel = state['history_pos'], state['history_vel']
+        self.history = History(self.buffer, frames_pos[0], frames_vel[0])
+        for positions, velocities in zip(frames_pos[1:], frames_vel[1:]):
+            self.history.append(positions, velocities)
 
+    @profiled('energy')
     def kinetic(self):
+        if self.backend == 'numba':
+            return kernels.kinetic(self.velocities, self.masses)
         vel = np.sum(self.velocities**2, axis=1)
         kin = 0.5 * self.masses * vel
-        return np.sum(kin)
+        return np.sum(kin, dtype=np.float64)
     
+    @profiled('energy')
     def potential(self):
+        if self.fused_potential is not None:
+            positions, masses, potential = self.fused_potential
+            if np.array_equal(positions, self.positions) and np.array_equal(masses, self.masses):
+                return potential
+        if self.backend == 'numba':
+            return kernels.potential(self.positions, self.masses, Var.G, *self.kernel_softening)
         masses_matrix = self.masses[:, np.newaxis] * self.masses[np.newaxis, :]
         diff = self.positions[:, np.newaxis, :] - self.positions[np.newaxis, :, :]
         distances_sq = np.sum(diff**2, axis=2)
         np.fill_diagonal(distances_sq, np.inf)
-        inv_distances = 1.0 / np.sqrt(distances_sq)
+        inv_distances, _ = gravity.inverse_distances(distances_sq, self.softening, self.softening_kernel)
         pair_energies = -Var.G * masses_matrix * inv_distances
-        return np.sum(pair_energies) / 2.0
+        return np.sum(pair_energies, dtype=np.float64) / 2.0
     
\ No newline at end of file
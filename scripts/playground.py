@@ -1,13 +1,18 @@
 from __future__ import annotations
 import sys
+import time
 import numpy as np
 import pygame
 from pygame.locals import *
 
 from scripts.physics import PhysicsEngine
+from scripts.recording import Recorder, Recording
+from scripts import checkpoint
+from scripts.simthread import SimulationThread
 from scripts.const import Fonts, Colors, Var
-from scripts.ui_elements import Ball, Button, Slider, EnergyGraph
-from scripts.startpos import get_random
+from scripts.ui_elements import Ball, Bodies, Button, Slider, EnergyGraph, ProfileGraph
+from scripts.profiler import profiled, profiler
+from scripts.startpos import get_preset, random_arrays
 
 class Playground:
     class Camera:
@@ -17,6 +22,8 @@ class Playground:
             self.pos:np.ndarray = np.zeros(2, dtype=Var.dtype)
             self.zoom_val:float = 1.0
             self.playground:Playground = playground
+            self.sprites:dict[tuple, pygame.Surface] = {} # pre-drawn ball outlines by (radius, color)
+            self.trail_cache:tuple = (None, []) # (camera and history it was made for, lines)
 
         def move(self, pixel_pos):
             """Move camera position relative to simulation"""
@@ -47,22 +54,57 @@ class Playground:
             world_pos = np.array(world_pos, dtype=Var.dtype)
             return (world_pos + self.pos) / self.zoom_val
 
+        def visible(self, screen_pos:np.ndarray, margin:float | np.ndarray = 0) -> np.ndarray:
+            """Mask of screen positions that are on the surface, grown by margin"""
+            width, height = self.surface.get_size()
+            x = screen_pos[..., 0]
+            y = screen_pos[..., 1]
+            return (x > -margin) & (x < width + margin) & (y > -margin) & (y < height + margin)
+
+        def sprite(self, radius:int, color:tuple) -> pygame.Surface:
+            """Outline of a ball as surface, drawn once per radius and color"""
+            key = radius, color
+            if key not in self.sprites:
+                if len(self.sprites) > 4096: # zooming makes new radii all the time
+                    self.sprites.clear()
+                surface = pygame.Surface((radius*2 + 3, radius*2 + 3), SRCALPHA)
+                pygame.draw.aacircle(surface, color, (radius + 1, radius + 1), radius, 2)
+                self.sprites[key] = surface
+            return self.sprites[key]
+
+        @profiled('draw balls')
         def balls(self):
-            """Draw balls"""
-            for ball in self.playground.balls:
-                screen_pos = self.to_screen_pos(ball.pos)
-                radius = ball.radius / self.zoom_val
-                pygame.draw.aacircle(self.surface, ball.color, 
-                                (int(screen_pos[0]), int(screen_pos[1])), 
-                                radius, 2)
-
+            """Draw balls, all positions get transformed and culled at once
+
+            Small balls are blitted from cached sprites, only big ones are drawn directly"""
+            bodies = self.playground.bodies
+            screen_pos = self.to_screen_pos(bodies.positions)
+            if not np.isfinite(screen_pos).all():
+                raise OverflowError('ball out of range')
+            radii = bodies.radii / self.zoom_val
+            shown = self.visible(screen_pos, radii + 2)
+            screen_pos = np.trunc(screen_pos[shown])
+            radii = radii[shown]
+            colors = bodies.colors[shown]
+
+            small = radii <= Var.sprite_radius_max
+            sprite_radii = np.maximum(1, np.round(radii[small])).astype(np.int64)
+            corners = (screen_pos[small] - sprite_radii[:, np.newaxis] - 1).astype(np.int64)
+            self.surface.fblits([
+                (self.sprite(radius, tuple(color)), corner)
+                for radius, color, corner in zip(sprite_radii.tolist(), colors[small].tolist(), corners.tolist())
+            ])
+            for pos, radius, color in zip(screen_pos[~small].tolist(), radii[~small].tolist(), colors[~small].tolist()):
+                pygame.draw.aacircle(self.surface, color, pos, radius, 2)
+
+        @profiled('draw center')
         def center(self):
             """Calculate position and draw center of mass"""
-            if not len(self.playground.balls): 
+            if not len(self.playground.bodies): 
                 return
                 
-            masses = np.array([b.radius**2 for b in self.playground.balls])
-            positions = np.array([b.pos for b in self.playground.balls])
+            masses = self.playground.bodies.masses
+            positions = self.playground.bodies.positions
             
             center_pos = np.sum(positions * masses[:, np.newaxis], axis=0) / np.sum(masses)
             center_screen = self.to_screen_pos(center_pos)
@@ -76,12 +118,29 @@ class Playground:
             """Additional devug text
             
             Currently only the amount of balls in the bottom right corner"""
-            amt_txt = Fonts.medium.render(str(len(self.playground.balls)), True, Colors.text)
+            amt_txt = Fonts.medium.render(str(len(self.playground.bodies)), True, Colors.text)
             size = np.array(self.surface.get_size(), dtype=Var.dtype)
             text_size = np.array(amt_txt.get_size(), dtype=Var.dtype)
             pos = size - text_size - Var.pad
             self.surface.blit(amt_txt, (int(pos[0]), int(pos[1])))
 
+        @profiled('draw profile')
+        def profile(self):
+            """Draw the profiler panel, left of the energy graph"""
+            graph = self.playground.profile_graph
+            self.surface.blit(graph.draw(profiler), graph.position)
+
+        def status(self):
+            """Recording or replay state at the top of the screen"""
+            playground = self.playground
+            if playground.replay is not None:
+                text = f'replay {playground.replay_frame + 1}/{len(playground.replay)}'
+            else:
+                text = f'rec {len(playground.recorder)}'
+            surface = Fonts.medium.render(text, True, Colors.inactive)
+            self.surface.blit(surface, ((self.surface.get_width() - surface.get_width()) // 2, Var.pad))
+
+        @profiled('draw grid')
         def grid(self):
             """Calculate positions for draw points corrosponding to the grid
             Grid is used for snapping position or velocity for balls to perfect positions"""
@@ -100,25 +159,77 @@ class Playground:
             valid_points = grid_points[distances <= grid_radius]
             valid_distances = distances[distances <= grid_radius]
             lerp_vals = np.minimum(np.maximum(0, valid_distances / grid_radius), 1)
-            screen_points = np.array([self.to_screen_pos(point) for point in valid_points])
-            
-            for i, point in enumerate(screen_points):
-                lerp_val = lerp_vals[i]
-                color_mid = Colors.grid.lerp(Colors.background, lerp_val)
-                color_around = color_mid.lerp(Colors.background, 0.6)
-                px, py = int(point[0]), int(point[1])
-                self.surface.set_at((px, py), color_mid)
-                self.surface.set_at((px-1, py), color_around)
-                self.surface.set_at((px, py-1), color_around)
-                self.surface.set_at((px+1, py), color_around)
-                self.surface.set_at((px, py+1), color_around)
+            screen_points = self.to_screen_pos(valid_points).astype(np.int64)
+
+            grid_color = np.array(Colors.grid[:3], dtype=Var.dtype)
+            background = np.array(Colors.background[:3], dtype=Var.dtype)
+            color_mid = grid_color + (background - grid_color) * lerp_vals[:, np.newaxis]
+            color_around = color_mid + (background - color_mid) * 0.6
+            width, height = self.surface.get_size()
+            pixels = pygame.surfarray.pixels3d(self.surface)
+            for (dx, dy), colors in (((0, 0), color_mid), ((-1, 0), color_around), ((0, -1), color_around), ((1, 0), color_around), ((0, 1), color_around)):
+                px = screen_points[:, 0] + dx
+                py = screen_points[:, 1] + dy
+                inside = (0 <= px) & (px < width) & (0 <= py) & (py < height)
+                pixels[px[inside], py[inside]] = colors[inside]
+            del pixels # unlocks the surface
+
+        def trails(self) -> list[np.ndarray] | np.ndarray:
+            """Screen space polylines of the history, clipped to the screen and decimated to the zoom level
+
+            Points closer than Var.trail_lod pixels along a trail get merged, parts of a trail that are
+            off screen are cut out. With a lot of trails on screen only their points get returned.
+            The result is reused as long as the camera and the history did not change"""
+            history = self.playground.history_pos
+            key = (self.zoom_val, *self.pos, *self.surface.get_size(), history.shape,
+                   history[0].tobytes() if len(history) else b'', history[-1].tobytes() if len(history) else b'')
+            if self.trail_cache[0] == key:
+                return self.trail_cache[1]
+
+            screen = self.to_screen_pos(history).transpose(1, 0, 2) # (balls, frames, 2)
+            if screen.shape[1] < 2:
+                lines = []
+            else:
+                on_screen = self.visible(screen)
+                near = on_screen.copy() # keep the neighbours too, so segments that leave the screen are not cut short
+                near[:, 1:] |= on_screen[:, :-1]
+                near[:, :-1] |= on_screen[:, 1:]
 
+                if near.any(axis=1).sum() >= Var.trail_points_min:
+                    lines = screen[on_screen].astype(np.int64)
+                else:
+                    travelled = np.zeros(near.shape)
+                    np.cumsum(np.sqrt(np.sum(np.diff(screen, axis=1)**2, axis=2)), axis=1, out=travelled[:, 1:])
+                    cell = np.floor(travelled / Var.trail_lod)
+                    starts = near.copy() # first point of every visible piece
+                    starts[:, 1:] &= ~near[:, :-1]
+                    ends = near.copy() # last point of every visible piece
+                    ends[:, :-1] &= ~near[:, 1:]
+                    keep = starts | ends
+                    keep[:, 1:] |= cell[:, 1:] != cell[:, :-1]
+                    keep &= near
+
+                    points = screen[keep].astype(np.float64) # pygame takes no float32
+                    piece = np.cumsum(starts[keep]) # pieces are numbered in the same order the points come out
+                    lines = [line for line in np.split(points, np.flatnonzero(np.diff(piece)) + 1) if len(line) > 1]
+
+            self.trail_cache = key, lines
+            return lines
+
+        @profiled('draw paths')
         def history(self):
             """Draw history of balls"""
-            for i in range(len(self.playground.balls)):
-                line = self.playground.physics.history_pos[:, i, :]
-                pygame.draw.aalines(self.surface, 'white', False, self.to_screen_pos(line))
+            lines = self.trails()
+            if isinstance(lines, np.ndarray): # too many trails, only points
+                pixels = pygame.surfarray.pixels3d(self.surface)
+                pixels[lines[:, 0], lines[:, 1]] = 255
+                del pixels
+                return
 
+            for line in lines:
+                pygame.draw.aalines(self.surface, 'white', False, line)
+
+        @profiled('draw ui')
         def ui(self):
             """Draw entire ui
 
@@ -129,6 +240,9 @@ class Playground:
             for button in self.playground.buttons_solver:
                 self.surface.blit(button.surface, button.pos)
 
+            for button in self.playground.buttons_force:
+                self.surface.blit(button.surface, button.pos)
+
             for slider in self.playground.sliders:
                 self.surface.blit(slider.surface, slider.rect.topleft)
             
@@ -136,14 +250,15 @@ class Playground:
 
             self.debug_txt()
 
+        @profiled('draw velocity')
         def vel(self):
             """Draw a line for each ball corrosponding to a scaled velocity Vector"""
-            for ball in self.playground.balls:
-                start = self.to_screen_pos(ball.pos)
-                end = self.to_screen_pos(ball.pos + ball.vel * 30)
-                pygame.draw.aaline(self.surface, Colors.vel_vector, 
-                                (int(start[0]), int(start[1])), 
-                                (int(end[0]), int(end[1])))
+            bodies = self.playground.bodies
+            starts = self.to_screen_pos(bodies.positions)
+            ends = self.to_screen_pos(bodies.positions + bodies.velocities * 30)
+            shown = self.visible(starts) | self.visible(ends)
+            for start, end in zip(np.trunc(starts[shown]).tolist(), np.trunc(ends[shown]).tolist()):
+                pygame.draw.aaline(self.surface, Colors.vel_vector, start, end)
 
         def draw(self):
             """Main draw function"""
@@ -162,6 +277,12 @@ class Playground:
             if self.playground.show_hud:
                 self.ui()
 
+            if self.playground.recorder is not None or self.playground.replay is not None:
+                self.status()
+
+            if profiler.enabled:
+                self.profile()
+
             return self.surface
 
         functions = {
@@ -181,6 +302,10 @@ class Playground:
         self.pressed_shift = False
         self.pressed_left = False
         self.pressed_right = False
+        self.hover = -1 # index of the ball under the mouse
+        self.held = -1 # index of the ball being dragged
+        self.held_left = False
+        self.held_right = False
         self.dragging = False
         self.show_grid = False
         self.show_hud = False
@@ -189,10 +314,19 @@ class Playground:
         self.mouse_pos = np.array((0,0),dtype=Var.dtype)
         self.infos_states = {n:False for n in self.Camera.functions}
         self.solver_method = 'euler'
-        self.balls = get_random()
-        self.start_balls = [b.copy() for b in self.balls]
-        self.physics = PhysicsEngine(self.dt, balls=self.balls)
+        self.start = Bodies(*(get_preset(Var.scene) if Var.scene else random_arrays())) # what reset goes back to
+        self.bodies = self.start.copy() # what gets drawn, views of the displayed frame of the physics
+        self.physics = PhysicsEngine(self.dt)
+        self.simulation:SimulationThread = None # runs the physics in the background when threaded
+        self.last_frame = -1 # last snapshot frame applied to the balls
+        self.recorder:Recorder = None # streams the displayed frames to Var.record_path
+        self.replay:Recording = None # frames shown instead of the physics, straight from disk
+        self.replay_frame = 0
+        self.live_bodies:Bodies = None # bodies of the simulation while the replay is shown
+        self.checkpointer = checkpoint.Checkpointer(Var.checkpoint_path)
+        self.last_checkpoint = time.perf_counter() # for Var.checkpoint_interval
         self.energy_graph = EnergyGraph((Var.window_size-Var.energy_graph_size, Var.energy_graph_size))
+        self.profile_graph = ProfileGraph(self.profile_rect())
 
         fontheight = Fonts.large.get_height() + Var.pad
         self.buttons_debug:list[Button] = []
@@ -202,12 +336,19 @@ class Playground:
         self.buttons_debug.append(Button((Var.pad,Var.pad+(y+1)*fontheight), 'collision', Colors.inactive))
 
         self.buttons_solver:list[Button] = []
-        for idx, name in enumerate(['euler','runge_kutta']):
+        for idx, name in enumerate(PhysicsEngine.methods):
             button = Button((self.window.width - Fonts.large.size(name)[0] - Var.pad, Var.pad + fontheight * idx), name, Colors.inactive)
             self.buttons_solver.append(button)
         self.buttons_solver[0].color = Colors.active
         self.buttons_solver[0].draw()
 
+        self.buttons_force:list[Button] = []
+        for idx, name in enumerate(PhysicsEngine.force_methods, len(self.buttons_solver) + 1):
+            button = Button((self.window.width - Fonts.large.size(name)[0] - Var.pad, Var.pad + fontheight * idx), name, Colors.inactive)
+            self.buttons_force.append(button)
+        self.buttons_force[0].color = Colors.active
+        self.buttons_force[0].draw()
+
         self.sliders = [
             Slider('dt', 0, self.dt*2, (Var.pad, int(self.window.height-Var.slider_size[1]-Var.pad), int(Var.slider_size[0]), int(Var.slider_size[1]))),
             Slider('fps', 0, 300, (Var.pad, int(self.window.height-Var.slider_size[1]*2-Var.pad*2), int(Var.slider_size[0]), int(Var.slider_size[1]))),
@@ -221,13 +362,8 @@ class Playground:
     def handle_event(self, event:pygame.Event):
         calls = []
 
-        for idx, ball in enumerate(self.balls):
-            if any(s.hover for s in self.sliders): break
-            if calls_ball := ball.handle_event(event, self.grid_size, self.camera):
-                if 'dragged_ball' in calls_ball:
-                    self.physics.from_balls(self.balls)
-                    self.dragging = False
-                calls.extend(calls_ball)
+        if not any(s.hover for s in self.sliders) and self.replay is None:
+            calls.extend(self.handle_ball_event(event))
         
         for button in self.buttons_debug:
             if button.handle_event(event):
@@ -235,18 +371,27 @@ class Playground:
                     self.infos_states[button.text] = not self.infos_states[button.text]
                     button.color = Colors.active if self.infos_states[button.text] else Colors.inactive
                 elif button.text == 'collision':
-                    self.physics.collision_enabled = not self.physics.collision_enabled
-                    self.physics.from_balls(self.balls)
-                    button.color = Colors.active if self.physics.collision_enabled else Colors.inactive
+                    enabled = not self.physics.collision_enabled
+                    self.command(setattr, self.physics, 'collision_enabled', enabled)
+                    self.command(self.physics.repredict)
+                    button.color = Colors.active if enabled else Colors.inactive
                 button.draw()
         
         for button in self.buttons_solver:
             if button.handle_event(event):
-                self.physics.method = self.physics.runge_kutta_step if button.text == 'runge_kutta' else self.physics.euler_step
+                self.command(setattr, self.physics, 'method', getattr(self.physics, f'{button.text}_step'))
                 for b in self.buttons_solver:
                     b.color = Colors.active if b is button else Colors.inactive
                     b.draw()
-                self.physics.from_balls(self.balls)
+                self.command(self.physics.repredict)
+
+        for button in self.buttons_force:
+            if button.handle_event(event):
+                self.command(setattr, self.physics, 'force_method', getattr(self.physics, PhysicsEngine.force_methods[button.text]))
+                for b in self.buttons_force:
+                    b.color = Colors.active if b is button else Colors.inactive
+                    b.draw()
+                self.command(self.physics.repredict)
 
         for slider in self.sliders:
             if slider.handle_event(event):
@@ -254,11 +399,10 @@ class Playground:
                     Var.framerate_limit = int(slider.val)
                 elif slider.name == 'dt':
                     self.dt = slider.val
-                    self.physics.dt = slider.val
-                    self.physics.from_balls(self.balls)
+                    self.command(setattr, self.physics, 'dt', slider.val)
+                    self.command(self.physics.repredict)
                 elif slider.name == 'paths':
-                    self.physics.buffer = int(slider.val)
-                    self.physics.from_balls(self.balls)
+                    self.command(self.physics.set_buffer, int(slider.val))
                 self.dragging = False
 
         if event.type == pygame.QUIT:
@@ -268,6 +412,10 @@ class Playground:
         elif event.type == KEYDOWN:
             if event.key == K_SPACE:
                 self.playing = not self.playing
+                if self.simulation and self.playing:
+                    self.simulation.playing.set()
+                elif self.simulation:
+                    self.simulation.playing.clear()
 
             elif event.key == K_LCTRL:
                 self.pressed_ctrl = True
@@ -279,21 +427,50 @@ class Playground:
                 self.pressed_shift = True
 
             elif event.key == K_r:
-                if self.pressed_shift: # get new arrangement of balls
-                    self.start_balls = get_random()
+                if self.replay is not None: # back to the first frame
+                    self.seek(0)
+
+                elif self.pressed_shift: # get new arrangement of balls
+                    self.start = Bodies(*(get_preset(Var.scene) if Var.scene else random_arrays()))
                     self.reset()
 
-                elif any(b.hover for b in self.balls): # reset velocity from hovered ball
-                    index = [b.hover for b in self.balls].index(True)
-                    self.balls[index].vel = np.array((0,0),dtype=Var.dtype)
-                    self.physics.from_balls(self.balls)
+                elif self.hover >= 0: # reset velocity from hovered ball
+                    ball = self.bodies[self.hover]
+                    ball.vel = np.array((0,0),dtype=Var.dtype)
+                    self.command(self.physics.update_ball, self.hover, ball.copy())
                         
-                elif self.balls: # if no hovered ball, reset simulation
+                elif len(self.bodies): # if no hovered ball, reset simulation
                     self.reset()
 
             elif event.key == K_h:
                 self.show_hud = not self.show_hud
 
+            elif event.key == K_t:
+                self.toggle_threaded()
+
+            elif event.key == K_c:
+                self.toggle_recording()
+
+            elif event.key == K_p:
+                self.toggle_replay()
+
+            elif event.key == K_s:
+                self.save_checkpoint()
+
+            elif event.key == K_l:
+                self.load_checkpoint()
+
+            elif event.key == K_f:
+                if self.pressed_shift: # export what is there
+                    profiler.export(Var.profile_path)
+                else:
+                    profiler.toggle()
+                    profiler.clear()
+
+            elif event.key in (K_LEFT, K_RIGHT) and self.replay is not None:
+                skip = Var.replay_skip * (10 if self.pressed_shift else 1)
+                self.seek(self.replay_frame + (skip if event.key == K_RIGHT else -skip))
+
             elif event.key == K_F11:
                 self.fullscreen = not self.fullscreen
                 if self.fullscreen:
@@ -320,25 +497,26 @@ class Playground:
         elif event.type == MOUSEBUTTONDOWN:
             if event.button == 1:
                 hover = any((
-                    any(b.hover for b in self.balls),
+                    self.hover >= 0,
                     any(b.hover for b in self.buttons_debug),
                     any(b.hover for b in self.buttons_solver),
+                    any(b.hover for b in self.buttons_force),
                     any(s.hover for s in self.sliders)
                 ))
                 if not hover: # careful with empty balls list
                     self.dragging = True
                 
 
-            elif event.button == 2:
-                for idx, ball in enumerate(self.balls):
-                    if ball.hover:
-                        del self.balls[idx]
-                        self.physics.remove_ball(idx)
-                        break
+            elif event.button == 2 and self.replay is None:
+                self.stop_recording() # the amount of balls changes
+                if self.hover >= 0:
+                    self.bodies.remove(self.hover)
+                    self.command(self.physics.remove_ball, self.hover)
+                    self.hover = -1
                 else:
                     ball = Ball(position=self.camera.to_world_pos(event.pos))
-                    self.balls.append(ball)
-                    self.physics.add_ball(ball)
+                    self.bodies.append(ball)
+                    self.command(self.physics.add_ball, ball)
             
             elif event.button == 3:
                 self.pressed_right = True
@@ -372,22 +550,204 @@ class Playground:
 
         self.show_grid = self.show_grid or self.pressed_ctrl
 
+    def handle_ball_event(self, event:pygame.Event) -> list:
+        """Hover, drag and resize balls, hit testing runs on the arrays of all balls at once"""
+        calls = []
+        if event.type == MOUSEBUTTONDOWN and self.hover >= 0 and event.button in (1, 3):
+            self.held = self.hover
+            self.held_left = self.held_left or event.button == 1
+            self.held_right = self.held_right or event.button == 3
+
+        elif event.type == MOUSEBUTTONUP:
+            if event.button == 1:
+                self.held_left = False
+            elif event.button == 3:
+                self.held_right = False
+            if not (self.held_left or self.held_right):
+                self.held = -1
+
+        elif event.type == MOUSEMOTION:
+            self.hover = self.bodies.at(self.camera.to_world_pos(event.pos))
+            if 0 <= self.held < len(self.bodies):
+                ball = self.bodies[self.held]
+                ball.drag(event, self.grid_size, self.camera, self.held_left, self.held_right, self.pressed_ctrl)
+                self.command(self.physics.update_ball, self.held, ball.copy())
+                self.dragging = False
+                calls.append('dragged_ball')
+
+        return calls
+
+    @profiled('blit')
     def draw(self):
         self.window.blit(self.camera.draw(), (0,0))
 
     def update(self):
         self.draw()
         if not self.playing: return
+
+        if Var.checkpoint_interval and time.perf_counter() - self.last_checkpoint > Var.checkpoint_interval:
+            self.save_checkpoint()
+
+        if self.replay is not None:
+            self.seek(self.replay_frame + 1)
+            return
+
+        if self.simulation:
+            snapshot = self.simulation.latest()
+            if snapshot.generation != self.simulation.submitted or snapshot.frame == self.last_frame:
+                return # still simulating from before the last edit, or nothing new
+            self.last_frame = snapshot.frame
+            self.bodies.bind(snapshot.positions, snapshot.velocities, snapshot.radii, snapshot.masses, copy=True)
+            self.energy_graph.update(snapshot.potential, snapshot.kinetic)
+            return
+
         self.physics.update_physics()
-        self.physics.update_balls(self.balls)
+        self.sync()
         self.energy_graph.update(
             self.physics.potential(),
             self.physics.kinetic()
         )
 
+    @property
+    def history_pos(self) -> np.ndarray:
+        """Position history to draw, from the latest snapshot when threaded
+
+        In replay the frames around the shown one, read from disk"""
+        if self.replay is not None:
+            start = max(0, self.replay_frame - self.physics.buffer//2)
+            return self.replay.positions[start:start + self.physics.buffer]
+        if self.simulation:
+            return self.simulation.latest().history_pos
+        return self.physics.history_pos
+
+    def sync(self):
+        """Point the bodies at the displayed frame of the physics, nothing gets copied"""
+        physics = self.physics
+        index = physics.current
+        self.bodies.bind(physics.history_pos[index], physics.history_vel[index], physics.radii, physics.masses)
+
+    def command(self, function, *args):
+        """Change the physics, on the simulation thread if there is one"""
+        if self.simulation:
+            self.simulation.submit(function, *args)
+        else:
+            function(*args)
+            self.sync()
+
+    def toggle_threaded(self):
+        """Move the physics to a background thread or back into the render loop"""
+        if self.simulation:
+            self.simulation.stop()
+            self.simulation = None
+            if self.replay is None:
+                self.sync()
+        else:
+            self.simulation = SimulationThread(self.physics)
+            if self.playing:
+                self.simulation.playing.set()
+            self.simulation.start()
+
+    def toggle_recording(self):
+        """Start streaming every displayed frame to Var.record_path, or stop it"""
+        if self.recorder is not None:
+            self.stop_recording()
+            return
+        if self.replay is not None:
+            return
+        self.recorder = Recorder(Var.record_path, self.bodies.radii, self.bodies.masses, self.physics.dt, Var.steps_per_draw, self.physics.dtype)
+        self.command(setattr, self.physics, 'recorder', self.recorder)
+
+    def stop_recording(self):
+        """Detach the recorder from the physics and close the file, after everything queued got written"""
+        if self.recorder is None:
+            return
+        self.command(setattr, self.physics, 'recorder', None)
+        self.command(self.recorder.close)
+        self.recorder = None
+
+    def toggle_replay(self):
+        """Show the frames of Var.record_path instead of the simulation, or go back to it"""
+        if self.replay is not None:
+            self.replay = None
+            self.bodies = self.live_bodies
+            self.last_frame = -1 # threaded: take the next snapshot even if it is old
+            if not self.simulation:
+                self.sync()
+            return
+
+        self.stop_recording()
+        try:
+            replay = Recording(Var.record_path)
+        except (OSError, ValueError) as error:
+            print(f'no replay: {error}')
+            return
+        self.replay = replay
+        self.live_bodies = self.bodies
+        same = len(self.bodies) == replay.count
+        self.bodies = Bodies(
+            np.zeros((replay.count, 2)), np.zeros((replay.count, 2)), replay.radii, replay.masses,
+            self.bodies.colors if same else None, self.bodies.ids if same else None,
+        )
+        self.hover = self.held = -1
+        self.seek(0)
+
+    def seek(self, frame:int):
+        """Show frame of the replay, only that frame gets read from disk"""
+        if frame >= len(self.replay):
+            self.replay.refresh() # a recording might still be running
+        self.replay_frame = min(max(0, frame), len(self.replay) - 1)
+        if self.replay_frame >= 0:
+            self.bodies.bind(self.replay.positions[self.replay_frame], self.replay.velocities[self.replay_frame], self.replay.radii, self.replay.masses, copy=True)
+
+    def save_checkpoint(self):
+        """Save the engine to Var.checkpoint_path, the state is copied between two physics frames and written in the background"""
+        self.last_checkpoint = time.perf_counter()
+        if self.simulation:
+            self.simulation.submit(self.checkpointer.submit, self.physics)
+        else:
+            self.checkpointer.submit(self.physics)
+
+    def load_checkpoint(self):
+        """Continue from Var.checkpoint_path, nothing gets simulated again"""
+        try:
+            state = checkpoint.load(Var.checkpoint_path)
+        except (OSError, ValueError, KeyError) as error:
+            print(f'no checkpoint: {error}')
+            return
+        if self.replay is not None:
+            self.toggle_replay()
+        self.stop_recording()
+
+        index = max(0, len(state['history_pos']) - int(state['buffer'])//2) # the displayed frame
+        same = len(self.bodies) == len(state['radii'])
+        self.bodies = Bodies(
+            state['history_pos'][index], state['history_vel'][index], state['radii'], state['masses'],
+            self.bodies.colors if same else None, self.bodies.ids if same else None,
+        )
+        self.hover = self.held = -1
+        self.last_frame = -1
+        self.dt = float(state['dt'])
+        self.sliders[0].val = self.dt
+        self.sliders[0].draw()
+
+        for button in self.buttons_solver:
+            button.color = Colors.active if f'{button.text}_step' == state['method'] else Colors.inactive
+            button.draw()
+        for button in self.buttons_force:
+            button.color = Colors.active if PhysicsEngine.force_methods[button.text] == state['force_method'] else Colors.inactive
+            button.draw()
+        for button in self.buttons_debug:
+            if button.text == 'collision':
+                button.color = Colors.active if state['collisions'] else Colors.inactive
+                button.draw()
+
+        self.command(self.physics.load_state, state)
+
     def reset(self):
-        self.balls = [b.copy() for b in self.start_balls]
-        self.physics.from_balls(self.balls)
+        self.stop_recording()
+        self.bodies = self.start.copy()
+        self.hover = self.held = -1
+        self.command(self.physics.from_arrays, self.start.positions, self.start.velocities, self.start.radii, self.start.masses)
         self.camera.pos = np.array((0,0),Var.dtype)
         self.camera.zoom_val = 1
 
@@ -397,10 +757,16 @@ class Playground:
         for idx, slider in enumerate(self.sliders):
             slider.rect = pygame.Rect((Var.pad, self.window.height-35*(idx+1), 100, 30))
         
-        for button in self.buttons_solver:
+        for button in self.buttons_solver + self.buttons_force:
             button.pos[0] = self.window.width - Fonts.large.size(button.text)[0] - Var.pad
 
         self.energy_graph.resize((
             self.window.size - Var.energy_graph_size,
             Var.energy_graph_size
         ))
+        self.profile_graph.resize(self.profile_rect())
+
+    def profile_rect(self) -> tuple:
+        """Profiler panel goes left of the energy graph"""
+        size = np.array(self.window.size)
+        return (size - Var.profile_graph_size - (Var.energy_graph_size[0] + Var.pad, 0), Var.profile_graph_size)
@@ -0,0 +1,135 @@
+"""Per phase timings of every frame, kept for the last Var.profile_frames frames
+
+Phases nest, a phase only counts the time its inner phases did not take. So 'integration'
+is the integrator itself and the forces it asks for show up under 'forces'.
+Turned off the only cost is one attribute check per profiled call"""
+from __future__ import annotations
+import contextlib
+import functools
+import json
+import threading
+import time
+import numpy as np
+from scripts.settings import Var
+
+class Phase:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler:Profiler, name:str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.stack().append(self)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stack = self.profiler.stack()
+        stack.pop()
+        self.profiler.add(self.name, elapsed)
+        if stack: # the outer phase did not spend this time itself
+            self.profiler.add(stack[-1].name, -elapsed)
+
+class Profiler:
+    """Collects phase timings, end_frame moves them into the rolling history"""
+    def __init__(self, frames:int=None):
+        self.enabled = False
+        self.capacity = frames or Var.profile_frames
+        self.samples:dict[str, np.ndarray] = {} # seconds per frame of every phase, ring buffers
+        self.current:dict[str, float] = {} # seconds of the running frame
+        self.head = 0
+        self.size = 0
+        self.last = time.perf_counter() # end of the last frame
+        self.local = threading.local() # every thread nests its own phases
+
+    def __repr__(self):
+        return f'<Profiler frames:{self.size} phases:{len(self.samples)} {"on" if self.enabled else "off"}>'
+
+    def stack(self) -> list[Phase]:
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def phase(self, name:str) -> Phase | contextlib.nullcontext:
+        """Context manager timing the code inside it as name"""
+        return Phase(self, name) if self.enabled else NOTHING
+
+    def add(self, name:str, seconds:float):
+        current = self.current
+        current[name] = current.get(name, 0.0) + seconds
+
+    def end_frame(self):
+        """Close the running frame, its length is stored as 'frame'"""
+        now = time.perf_counter()
+        frame, self.last = now - self.last, now
+        if not self.enabled:
+            return
+        current, self.current = self.current, {} # swapped, so other threads add to the next frame
+        current['frame'] = frame
+        for name in current.keys() - self.samples.keys():
+            self.samples[name] = np.zeros(self.capacity)
+        for name, samples in self.samples.items():
+            samples[self.head] = current.get(name, 0.0)
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.current = {}
+        self.last = time.perf_counter()
+
+    def clear(self):
+        self.samples = {}
+        self.current = {}
+        self.head = self.size = 0
+
+    def history(self, name:str) -> np.ndarray:
+        """Seconds of name in the stored frames, oldest first"""
+        samples = self.samples.get(name)
+        if samples is None:
+            return np.zeros(0)
+        return np.roll(samples, -self.head)[self.capacity - self.size:]
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Mean, median, 95th percentile and max seconds of every phase, slowest phases first"""
+        result = {}
+        for name in self.samples:
+            history = self.history(name)
+            if len(history):
+                result[name] = {
+                    'mean': float(history.mean()),
+                    'median': float(np.median(history)),
+                    'p95': float(np.percentile(history, 95)),
+                    'max': float(history.max()),
+                }
+        return dict(sorted(result.items(), key=lambda item: -item[1]['mean']))
+
+    def export(self, path:str):
+        """Write the stored frames, .csv gets one row per frame and one column per phase, anything else json with stats"""
+        names = list(self.stats())
+        if path.endswith('.csv'):
+            table = np.column_stack([self.history(name) for name in names]) if names else np.zeros((0, 0))
+            np.savetxt(path, table, delimiter=',', header=','.join(names), comments='', fmt='%.9f')
+            return
+        with open(path, 'w') as file:
+            json.dump({
+                'frames': self.size,
+                'stats': self.stats(),
+                'samples': {name: self.history(name).tolist() for name in names},
+            }, file, indent=2)
+
+NOTHING = contextlib.nullcontext()
+profiler = Profiler() # the one everything reports to
+
+def profiled(name:str):
+    """Decorator timing every call of a function as phase name"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            with Phase(profiler, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
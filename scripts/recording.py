@@ -0,0 +1,138 @@
+"""Trajectories on disk: a header, the radii and masses, then one fixed size frame per displayed frame
+
+Every frame holds the positions and then the velocities of all balls, so frame i starts at
+offset + i * stride and np.memmap can hand out any frame without reading the others"""
+import struct
+import numpy as np
+from scripts.settings import Var
+
+MAGIC = b'GRAVREC\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQQdQ') # magic, version, itemsize, balls, frames, chunk, dt, steps per frame
+HEADER_SIZE = 64 # header is padded to this
+FRAMES_FIELD = 24 # byte offset of the frame count in the header
+
+def read_header(path:str) -> dict:
+    with open(path, 'rb') as file:
+        magic, version, itemsize, count, frames, chunk, dt, steps = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a recording')
+    if version != VERSION:
+        raise ValueError(f'{path} has version {version}, only {VERSION} is supported')
+    dtype = np.dtype(f'<f{itemsize}')
+    return {
+        'dtype': dtype,
+        'count': count,
+        'frames': frames,
+        'chunk': chunk,
+        'dt': dt,
+        'steps': steps,
+        'offset': HEADER_SIZE + 2 * count * dtype.itemsize, # radii and masses come first
+    }
+
+class Recorder:
+    """Appends frames to a recording, the file grows by chunk frames at a time
+
+    The frame count in the header is written every chunk and on close,
+    so a crash loses at most the last chunk"""
+    def __init__(self, path:str, radii:np.ndarray, masses:np.ndarray, dt:float, steps:int=1, dtype=None, chunk:int=None):
+        self.path = path
+        self.dtype = np.dtype(dtype or radii.dtype).newbyteorder('<')
+        self.count = len(radii)
+        self.chunk = max(1, int(chunk or Var.record_chunk))
+        self.frames = 0 # written so far
+        self.capacity = 0 # frames the file has room for
+        self.offset = HEADER_SIZE + 2 * self.count * self.dtype.itemsize
+        self.stride = 2 * self.count * 2 * self.dtype.itemsize
+        self.map:np.memmap = None
+
+        self.file = open(path, 'w+b')
+        header = HEADER.pack(MAGIC, VERSION, self.dtype.itemsize, self.count, 0, self.chunk, dt, steps)
+        self.file.write(header.ljust(HEADER_SIZE, b'\x00'))
+        self.file.write(np.asarray(radii, dtype=self.dtype).tobytes())
+        self.file.write(np.asarray(masses, dtype=self.dtype).tobytes())
+        self.file.flush()
+
+    def __repr__(self):
+        return f'<Recorder {self.path} frames:{self.frames} amt:{self.count}>'
+
+    def __len__(self):
+        return self.frames
+
+    def grow(self):
+        """Make room for another chunk of frames and map it"""
+        if self.map is not None:
+            self.map.flush()
+        self.capacity += self.chunk
+        self.file.truncate(self.offset + self.capacity * self.stride)
+        if self.count:
+            self.map = np.memmap(self.file, dtype=self.dtype, mode='r+', offset=self.offset, shape=(self.capacity, 2, self.count, 2))
+
+    def append(self, positions:np.ndarray, velocities:np.ndarray):
+        """Write the next frame, the amount of balls has to stay the same"""
+        if len(positions) != self.count:
+            raise ValueError(f'recording has {self.count} balls, got {len(positions)}')
+        if self.frames == self.capacity:
+            if self.frames:
+                self.flush()
+            self.grow()
+        if self.count:
+            self.map[self.frames, 0] = positions
+            self.map[self.frames, 1] = velocities
+        self.frames += 1
+
+    def flush(self):
+        """Write the mapped frames and the frame count to disk"""
+        if self.map is not None:
+            self.map.flush()
+        self.file.seek(FRAMES_FIELD)
+        self.file.write(struct.pack('<Q', self.frames))
+        self.file.flush()
+
+    def close(self):
+        """Flush and cut the file down to the written frames"""
+        if self.file.closed:
+            return
+        self.flush()
+        self.map = None
+        self.file.truncate(self.offset + self.frames * self.stride)
+        self.file.close()
+
+class Recording:
+    """Read only access to a recording, frames are only read from disk when they get indexed"""
+    def __init__(self, path:str):
+        self.path = path
+        self.frames:np.ndarray = None # (frames, 2, balls, 2), positions then velocities
+        header = read_header(path)
+        self.dtype = header['dtype']
+        self.count = header['count']
+        self.dt = header['dt'] # of one physics step
+        self.steps = header['steps'] # physics steps per frame
+        self.radii = np.fromfile(path, dtype=self.dtype, count=self.count, offset=HEADER_SIZE)
+        self.masses = np.fromfile(path, dtype=self.dtype, count=self.count, offset=HEADER_SIZE + self.count * self.dtype.itemsize)
+        self.refresh()
+
+    def __repr__(self):
+        return f'<Recording {self.path} frames:{len(self)} amt:{self.count}>'
+
+    def __len__(self):
+        return len(self.frames)
+
+    def refresh(self) -> int:
+        """Map the frames again, picks up what a running recorder has written since. Returns the frame count"""
+        header = read_header(self.path)
+        if header['frames'] and self.count:
+            self.frames = np.memmap(self.path, dtype=self.dtype, mode='r', offset=header['offset'], shape=(header['frames'], 2, self.count, 2))
+        else:
+            self.frames = np.zeros((header['frames'], 2, self.count, 2), dtype=self.dtype)
+        return len(self.frames)
+
+    @property
+    def positions(self) -> np.ndarray:
+        """Positions of all frames, shape (frames, balls, 2), still on disk"""
+        return self.frames[:, 0]
+
+    @property
+    def velocities(self) -> np.ndarray:
+        """Velocities of all frames, shape (frames, balls, 2), still on disk"""
+        return self.frames[:, 1]
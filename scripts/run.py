@@ -0,0 +1,103 @@
+"""Headless simulation, runs without pygame and without a frame limiter
+
+python -m scripts.run --preset ngon:5 --steps 100000 --every 100 --method verlet --out run.npz"""
+import argparse
+import time
+import numpy as np
+from scripts import gravity
+from scripts.physics import PhysicsEngine
+from scripts.checkpoint import Checkpointer, restore
+from scripts.profiler import profiler
+from scripts.recording import Recorder
+from scripts.startpos import get_preset
+
+def simulate(engine:PhysicsEngine, steps:int, every:int=1, recorder:Recorder=None, checkpointer:Checkpointer=None, checkpoint_every:int=0, start_time:float=0.0) -> dict[str, np.ndarray]:
+    """Integrate steps substeps and take a snapshot every few substeps, snapshots also go to recorder if given
+
+    If steps is no multiple of every the last snapshot comes after the rest of the substeps.
+    With a checkpointer the engine gets saved every checkpoint_every snapshots, in the background"""
+    frames = -(-steps // every) + 1
+    snapshots = {
+        'time': np.full(frames, start_time),
+        'positions': np.empty((frames,) + engine.positions.shape),
+        'velocities': np.empty((frames,) + engine.velocities.shape),
+        'kinetic': np.empty(frames),
+        'potential': np.empty(frames),
+    }
+
+    for frame in range(frames):
+        if frame:
+            substeps = min(every, steps - (frame - 1) * every)
+            engine.advance(substeps)
+            snapshots['time'][frame] = snapshots['time'][frame - 1] + substeps * engine.dt
+        snapshots['positions'][frame] = engine.positions
+        snapshots['velocities'][frame] = engine.velocities
+        snapshots['kinetic'][frame] = engine.kinetic()
+        snapshots['potential'][frame] = engine.potential()
+        if recorder is not None:
+            recorder.append(engine.positions, engine.velocities)
+        if checkpointer is not None and checkpoint_every and frame and frame % checkpoint_every == 0:
+            checkpointer.submit(engine, time=snapshots['time'][frame])
+        profiler.end_frame() # a frame is one snapshot
+
+    return snapshots
+
+def main(argv:list[str]=None):
+    parser = argparse.ArgumentParser(prog='python -m scripts.run', description=__doc__.splitlines()[0])
+    parser.add_argument('--preset', default='random', help="start orbit, e.g. figure_8, ngon:5, sun_and_planets, random")
+    parser.add_argument('--steps', type=int, default=10000, help='amount of substeps to simulate')
+    parser.add_argument('--every', type=int, default=20, help='take a snapshot every this many substeps')
+    parser.add_argument('--dt', type=float, default=0.03)
+    parser.add_argument('--method', default='euler', choices=PhysicsEngine.methods)
+    parser.add_argument('--force', default='direct', choices=list(PhysicsEngine.force_methods))
+    parser.add_argument('--collisions', action='store_true')
+    parser.add_argument('--dtype', default='float64', choices=('float64', 'float32'), help='precision of the state and the pairwise terms')
+    parser.add_argument('--backend', default='numpy', choices=PhysicsEngine.backends, help='numba needs numba installed, falls back to numpy')
+    parser.add_argument('--softening', type=float, default=0.0, help='plummer equivalent softening length, 0 is pure newton')
+    parser.add_argument('--kernel', default='plummer', choices=gravity.softening_kernels, help='softening kernel')
+    parser.add_argument('--regularize', action='store_true', help='verlet and yoshida move tight bound pairs on exact kepler orbits')
+    parser.add_argument('--out', default='run.npz', help='snapshot file (.npz)')
+    parser.add_argument('--record', help='also stream every snapshot into this recording, the window replays it')
+    parser.add_argument('--checkpoint', help='save the whole engine here (.npz) every --checkpoint-every snapshots and at the end')
+    parser.add_argument('--checkpoint-every', type=int, default=100, help='snapshots between two checkpoints')
+    parser.add_argument('--profile', help='time every phase per snapshot and export the trace here (.json or .csv)')
+    parser.add_argument('--resume', help='continue from a checkpoint with its own settings, the preset and physics flags are ignored')
+    args = parser.parse_args(argv)
+    if args.regularize and args.softening > 0 and args.kernel == 'plummer':
+        parser.error('--regularize needs newton gravity around the pairs, use --kernel spline with --softening')
+
+    start_time = 0.0
+    if args.resume:
+        engine, state = restore(args.resume)
+        start_time = float(state.get('time', 0.0))
+    else:
+        engine = PhysicsEngine(args.dt, collisions=args.collisions, backend=args.backend, dtype=args.dtype)
+        engine.method = getattr(engine, f'{args.method}_step')
+        engine.force_method = getattr(engine, PhysicsEngine.force_methods[args.force])
+        engine.softening, engine.softening_kernel, engine.regularize = args.softening, args.kernel, args.regularize
+        engine.from_arrays(*get_preset(args.preset), update=False)
+
+    recorder = Recorder(args.record, engine.radii, engine.masses, engine.dt, args.every) if args.record else None
+    checkpointer = Checkpointer(args.checkpoint) if args.checkpoint else None
+    profiler.enabled = bool(args.profile)
+    start = time.perf_counter()
+    snapshots = simulate(engine, args.steps, args.every, recorder, checkpointer, args.checkpoint_every, start_time)
+    elapsed = time.perf_counter() - start
+    if recorder is not None:
+        recorder.close()
+    if checkpointer is not None:
+        checkpointer.wait()
+        checkpointer.submit(engine, time=snapshots['time'][-1])
+        checkpointer.wait()
+
+    np.savez(args.out, radii=engine.radii, masses=engine.masses, dt=engine.dt, **snapshots)
+    if args.profile:
+        profiler.export(args.profile)
+        for name, stat in profiler.stats().items():
+            print(f'{name:>12}: {stat["mean"]*1000:9.3f}ms mean {stat["p95"]*1000:9.3f}ms p95')
+    energy = snapshots['kinetic'] + snapshots['potential']
+    print(f'{args.steps} steps of {len(engine.positions)} balls in {elapsed:.2f}s ({args.steps / max(elapsed, 1e-9):.0f} steps/s)')
+    print(f'energy drift: {abs((energy[-1] - energy[0]) / energy[0]):.3e}, saved to {args.out}')
+
+if __name__ == '__main__':
+    main()
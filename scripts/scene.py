@@ -0,0 +1,103 @@
+"""Scene files: initial conditions as a json header followed by raw little endian arrays
+
+    magic (8 bytes) | header length (uint32) | json header | arrays, each starting on a multiple of 64 bytes
+
+The header names every array with its dtype, shape and offset, so loading is one read per array.
+.npz (arrays named positions, velocities, radii and optionally masses) and .csv (columns
+x, y, vx, vy, radius and optionally mass) load too.
+
+python -m scripts.scene galaxy:100000 --out galaxy.scene"""
+import argparse
+import json
+import struct
+import time
+import numpy as np
+
+MAGIC = b'GRAVSCN\x00'
+VERSION = 1
+ALIGN = 64
+extensions = ('.scene', '.npz', '.csv')
+names = ('positions', 'velocities', 'radii', 'masses')
+
+def _aligned(offset:int) -> int:
+    return -(-offset // ALIGN) * ALIGN
+
+def save(path:str, positions:np.ndarray, velocities:np.ndarray, radii:np.ndarray, masses:np.ndarray=None, dtype=np.float64, **meta):
+    """Write a scene, masses default to the area of the balls when loading. meta ends up in the header"""
+    arrays = dict(zip(names, (positions, velocities, radii, masses)))
+    arrays = {name: np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder('<')) for name, array in arrays.items() if array is not None}
+    header = {'version': VERSION, 'count': len(arrays['radii']), 'meta': meta, 'arrays': {}}
+
+    # offsets depend on the header length and the other way round, grows until it settles
+    length = 0
+    while True:
+        offset = _aligned(len(MAGIC) + 4 + length)
+        for name, array in arrays.items():
+            header['arrays'][name] = {'dtype': array.dtype.str, 'shape': array.shape, 'offset': offset}
+            offset = _aligned(offset + array.nbytes)
+        encoded = json.dumps(header).encode()
+        if len(encoded) <= length:
+            break
+        length = len(encoded)
+
+    with open(path, 'wb') as file:
+        file.write(MAGIC + struct.pack('<I', length) + encoded.ljust(length))
+        for name, array in arrays.items():
+            file.seek(header['arrays'][name]['offset'])
+            file.write(array.tobytes())
+
+def read_header(path:str) -> dict:
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a scene')
+        length, = struct.unpack('<I', file.read(4))
+        header = json.loads(file.read(length))
+    if header['version'] != VERSION:
+        raise ValueError(f'{path} has version {header["version"]}, only {VERSION} is supported')
+    return header
+
+def load(path:str) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """positions, velocities, radii and masses of a scene file, masses are the area of the balls if the file has none"""
+    if path.endswith('.npz'):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in names if name in data.files}
+    elif path.endswith('.csv'):
+        table = np.loadtxt(path, delimiter=',', ndmin=2, comments='#')
+        arrays = {'positions': table[:, 0:2], 'velocities': table[:, 2:4], 'radii': table[:, 4]}
+        if table.shape[1] > 5:
+            arrays['masses'] = table[:, 5]
+    else:
+        header = read_header(path)
+        arrays = {}
+        for name, info in header['arrays'].items():
+            shape = tuple(info['shape'])
+            arrays[name] = np.fromfile(path, dtype=info['dtype'], count=int(np.prod(shape)), offset=info['offset']).reshape(shape)
+
+    if 'masses' not in arrays:
+        arrays['masses'] = np.pi * arrays['radii']**2
+    return arrays['positions'], arrays['velocities'], arrays['radii'], arrays['masses']
+
+def main(argv:list[str]=None):
+    from scripts.startpos import get_preset
+
+    parser = argparse.ArgumentParser(prog='python -m scripts.scene', description='Write a preset or generator to a scene file')
+    parser.add_argument('preset', help="e.g. galaxy:100000, plummer:10000, disk:5000, lattice:100, figure_8")
+    parser.add_argument('--out', default='scene.scene', help='.scene, .npz or .csv')
+    parser.add_argument('--dtype', default='float64', choices=('float64', 'float32'))
+    args = parser.parse_args(argv)
+
+    arrays = get_preset(args.preset)
+    if args.out.endswith('.npz'):
+        np.savez(args.out, **dict(zip(names, arrays)))
+    elif args.out.endswith('.csv'):
+        columns = np.column_stack(arrays).astype(args.dtype)
+        np.savetxt(args.out, columns, delimiter=',', header='x,y,vx,vy,radius,mass' if columns.shape[1] > 5 else 'x,y,vx,vy,radius')
+    else:
+        save(args.out, *arrays, dtype=args.dtype, preset=args.preset)
+
+    start = time.perf_counter()
+    positions = load(args.out)[0]
+    print(f'{len(positions)} balls written to {args.out}, loading takes {(time.perf_counter() - start)*1000:.1f}ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+import numpy as np
+
+class Var:
+    window_size = np.array((800, 800)) # standard window size in pixel
+    monitor_size = np.array((1920,1080)) # default size of monitor, used for fullscreen, changed to real resolution on startup
+    slider_size = (100, 20) # x and y size of the sliders in pixel
+    framerate_limit = 150 # fps limit, because i feel like its a good idea idk...
+    steps_per_draw = 20 # amt of physics steps. helps boost performance
+    dtype = float # precision of the physics, np.float32 halves memory traffic. sums are always accumulated in float64
+    G = 1 # universal gravitational standard
+    backend = 'numpy' # 'numba' runs the hot loops compiled on all cores, needs numba installed
+    theta = 0.5 # barnes-hut opening angle. bigger is faster but less accurate
+    barnes_hut_min = 256 # below this amount of balls the direct summation is faster than the tree
+    softening = 0.0 # plummer equivalent softening length, keeps close passes from blowing up. 0 is pure newton
+    softening_kernel = 'plummer' # 'plummer' softens everywhere a little, 'spline' is exact newton beyond 2.8 * softening
+    regularize = False # verlet and yoshida move tight bound pairs along exact kepler orbits, not with plummer softening
+    regularize_distance = 10 # pairs closer than this can get regularized
+    tolerance = 1e-6 # relative local error allowed per adaptive step
+    block_eta = 0.01 # block timestep accuracy, fraction of the time the acceleration of a ball needs to change by itself
+    block_max_rung = 6 # block timestep splits dt at most 2**block_max_rung times
+    tile_size = 256 # edge length of the square tiles used by the tiled direct summation
+    sprite_radius_max = 128 # balls up to this radius on screen are blitted from cached sprites, bigger ones are drawn directly
+    trail_lod = 2 # trail points closer than this in pixel get merged
+    trail_points_min = 512 # from this amount of trails on screen they are plotted as points instead of lines
+    record_path = 'recording.grav' # where the recording key writes to and the replay key reads from
+    record_chunk = 256 # recordings grow by this many frames at a time
+    replay_skip = 10 # frames the arrow keys jump in replay, shift jumps ten times as far
+    scene = None # preset or scene file the window starts with and shift r goes back to, e.g. 'galaxy:2000' or 'galaxy.scene'. None picks a random orbit
+    checkpoint_path = 'checkpoint.npz' # where the save key writes to and the load key reads from
+    checkpoint_interval = 0 # seconds between automatic checkpoints of the window, 0 is off
+    profile_frames = 300 # frames the profiler keeps for its stats and histograms
+    profile_path = 'profile.json' # where the profiler exports to, .csv gets one row per frame
+    profile_graph_size = np.array((300, 150)) # width and height of the profiler panel, sits left of the energy graph
+    cicrcle_lightness = 75 # l value from hsLa used for making circle a nice pastel color
+    dampening = 0.998 # used in elastic collision only
+    pad = 5 # 5 pixel padding for ui elements (except ball ofc)
+    energy_graph_size = np.array((200, 150)) # width and height of energy graph
@@ -0,0 +1,126 @@
+from __future__ import annotations
+import queue
+import threading
+import time
+import traceback
+import numpy as np
+from scripts.settings import Var
+from scripts.physics import PhysicsEngine
+
+class Snapshot:
+    """Everything the renderer needs from one physics frame"""
+    def __init__(self):
+        self.positions:np.ndarray = np.zeros((0, 2)) # the displayed frame, middle of the history
+        self.velocities:np.ndarray = np.zeros((0, 2))
+        self.radii:np.ndarray = np.zeros(0)
+        self.masses:np.ndarray = np.zeros(0)
+        self.history_pos:np.ndarray = np.zeros((0, 0, 2))
+        self.kinetic = 0.0
+        self.potential = 0.0
+        self.generation = 0 # amount of commands applied before this snapshot was taken
+        self.frame = 0
+
+    def __repr__(self):
+        return f'<Snapshot frame:{self.frame} gen:{self.generation} amt:{len(self.positions)}>'
+
+    def write(self, physics:PhysicsEngine, generation:int, frame:int):
+        """Copy the current state of physics, reusing the arrays when the shapes still match"""
+        history = physics.history_pos
+        index = max(0, len(history) - physics.buffer//2)
+        if self.history_pos.shape != history.shape:
+            self.history_pos = np.empty_like(history)
+            self.positions = np.empty_like(history[0])
+            self.velocities = np.empty_like(history[0])
+        self.history_pos[:] = history
+        self.positions[:] = history[index]
+        self.velocities[:] = physics.history_vel[index]
+        self.radii = physics.radii.copy()
+        self.masses = physics.masses.copy()
+        self.kinetic = physics.kinetic()
+        self.potential = physics.potential()
+        self.generation = generation
+        self.frame = frame
+
+class SimulationThread(threading.Thread):
+    """Runs update_physics in the background and hands finished frames to the renderer
+
+    Snapshots are triple buffered: the worker writes the back one, then swaps it with the
+    ready one. The renderer swaps ready with front when it wants a new frame, so neither
+    side ever waits on the other or sees a half written frame.
+    Changes to the engine are sent as commands and run between two physics frames"""
+    def __init__(self, physics:PhysicsEngine):
+        super().__init__(daemon=True)
+        self.physics = physics
+        self.commands:queue.Queue = queue.Queue()
+        self.playing = threading.Event()
+        self.running = True
+        self.lock = threading.Lock()
+        self.front = Snapshot()
+        self.ready = Snapshot()
+        self.back = Snapshot()
+        self.fresh = False # ready holds a frame the renderer has not seen yet
+        self.submitted = 0 # commands sent, only touched by the renderer
+        self.processed = 0 # commands applied, only touched by the worker
+        self.frame = 0
+
+    def __repr__(self):
+        return f'<SimulationThread frame:{self.frame} playing:{self.playing.is_set()}>'
+
+    def submit(self, function, *args):
+        """Run function(*args) on the worker before its next physics frame"""
+        self.submitted += 1
+        self.commands.put((function, args))
+
+    def latest(self) -> Snapshot:
+        """Newest finished snapshot, stays valid until the next call"""
+        with self.lock:
+            if self.fresh:
+                self.front, self.ready = self.ready, self.front
+                self.fresh = False
+        return self.front
+
+    def stop(self):
+        """Let the worker finish its frame and the queued commands, then end it"""
+        self.running = False
+        self.commands.put(None) # wake the worker up
+        self.join()
+
+    def _publish(self):
+        self.back.write(self.physics, self.processed, self.frame)
+        with self.lock:
+            self.back, self.ready = self.ready, self.back
+            self.fresh = True
+
+    def _run_commands(self, timeout:float) -> bool:
+        """Apply queued commands, waits up to timeout for the first one"""
+        ran = False
+        try:
+            command = self.commands.get(timeout=timeout)
+            while True:
+                if command is not None:
+                    function, args = command
+                    try:
+                        function(*args)
+                    except Exception: # report it and go on, a dead worker would freeze the window
+                        print(f'command {getattr(function, "__name__", function)} failed:')
+                        traceback.print_exc()
+                    self.processed += 1
+                    ran = True
+                command = self.commands.get_nowait()
+        except queue.Empty:
+            return ran
+
+    def run(self):
+        self._publish()
+        next_frame = time.perf_counter()
+        while self.running:
+            wait = max(0.0, next_frame - time.perf_counter()) if self.playing.is_set() else 0.05
+            if self._run_commands(wait):
+                self._publish()
+
+            if self.playing.is_set() and time.perf_counter() >= next_frame:
+                self.physics.update_physics()
+                self.frame += 1
+                self._publish()
+                next_frame = max(next_frame + 1 / max(Var.framerate_limit, 1), time.perf_counter() - 0.1)
+        self._run_commands(0) # edits sent right before stop still have to land
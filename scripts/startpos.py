@@ -1,26 +1,33 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import os
 import numpy as np
 import random
 from math import pi
-from scripts.ui_elements import Ball
-from scripts.const import Var
+from scripts.settings import Var
+from scripts import scene
 
-def get_figure_8(scale:float): # figure 8 orbit (∞). Thanks to Faustino Palmero Ramos (https://www.maths.ed.ac.uk/~ateckent/vacation_reports/Report_Faustino.pdf)
+if TYPE_CHECKING:
+    from scripts.ui_elements import Ball
+
+# presets return (positions, velocities, radii) so they work without pygame, get_* wraps them into balls
+
+def figure_8(scale:float): # figure 8 orbit (∞). Thanks to Faustino Palmero Ramos (https://www.maths.ed.ac.uk/~ateckent/vacation_reports/Report_Faustino.pdf)
     vx = 0.3471128135672417 * scale # these values are copy pasted from the paper
     vy = 0.532726851767674 * scale  # and scaled up to match the default 800,800 winsize
     scale *= scale                  # the positions scale needs to be squared to the velocity
     mass = pi**0.5/pi * scale       # pi**0.5/pi is the mass of radius 1
 
-    return [
-        Ball(mass, np.array([400 - scale, 400]), np.array([   vx, -vy])),
-        Ball(mass, np.array([400        , 400]), np.array([-2*vx,2*vy])),
-        Ball(mass, np.array([400 + scale, 400]), np.array([   vx, -vy])),
-    ]
+    radii = np.full(3, mass)
+    positions = np.array([[400 - scale, 400], [400, 400], [400 + scale, 400]])
+    velocities = np.array([[vx, -vy], [-2*vx, 2*vy], [vx, -vy]])
+    return positions, velocities, radii
 
-def get_ngon(amount:int):
+def ngon(amount:int):
     """
     Create a regular n-gon orbit with n balls using NumPy vectorization.
     """
-    if amount < 2: return []
+    if amount < 2: return np.zeros((0, 2)), np.zeros((0, 2)), np.zeros(0)
     mass = 50
     radius = 250
     center = Var.window_size/2
@@ -28,17 +35,137 @@ def get_ngon(amount:int):
     angles = 2 * pi * np.arange(amount) / amount
     positions = center + radius * np.column_stack((np.cos(angles), np.sin(angles)))
     velocities = velocity_scale * np.column_stack((-np.sin(angles), np.cos(angles)))
-    return [Ball(mass, pos, vel) for pos, vel in zip(positions, velocities)]
+    return positions, velocities, np.full(amount, mass)
+
+def sun_and_planets():
+    """One heavy ball with two light ones orbiting it"""
+    radii = np.array([75, 20, 20])
+    positions = np.array([[380, 400], [680, 400], [720, 400]])
+    velocities = np.array([[0, 1], [0, -10.66], [0, -3.33]])
+    return positions, velocities, radii
+
+# generators for big procedural setups, these also return masses so the balls can stay small.
+# close passes between their many light balls want some softening, e.g. Var.softening = 2
+
+def plummer(amount:int, scale:float=100, mass:float=1e5, seed:int=None):
+    """Plummer sphere projected onto the screen plane
+
+    Radii and speeds are sampled from the 3d distribution (aarseth, henon & wielen 1974), positions keep x and y.
+    Velocities keep the whole 3d speed in the plane and get sqrt(pi/2) faster, because projecting brings
+    the balls closer together by that much on average. That keeps it in virial equilibrium"""
+    rng = np.random.default_rng(seed)
+    radius = scale / np.sqrt(rng.uniform(1e-3, 0.99, amount)**(-2/3) - 1) # cut the far tail
+    positions = Var.window_size/2 + _isotropic(rng, amount) * radius[:, np.newaxis]
+
+    # speed as fraction of the escape speed by rejection sampling g(q) = q² (1 - q²)^3.5, max below 0.1
+    q = np.empty(amount)
+    todo = np.arange(amount)
+    while len(todo):
+        candidates = rng.uniform(0, 1, len(todo))
+        accepted = rng.uniform(0, 0.1, len(todo)) < candidates**2 * (1 - candidates**2)**3.5
+        q[todo[accepted]] = candidates[accepted]
+        todo = todo[~accepted]
+    escape = np.sqrt(2 * Var.G * mass) * (radius**2 + scale**2)**-0.25
+    angles = rng.uniform(0, 2*pi, amount)
+    velocities = np.column_stack((np.cos(angles), np.sin(angles))) * (q * escape * np.sqrt(pi/2))[:, np.newaxis]
+    return positions, velocities, np.full(amount, 1.0), np.full(amount, mass / amount)
+
+def uniform_disk(amount:int, radius:float=300, mass:float=1e5, spin:float=1.0, seed:int=None):
+    """Balls spread evenly over a disk, spin is the fraction of the circular speed of the mass inside each ball"""
+    rng = np.random.default_rng(seed)
+    distances = radius * np.sqrt(rng.uniform(0, 1, amount))
+    angles = rng.uniform(0, 2*pi, amount)
+    direction = np.column_stack((np.cos(angles), np.sin(angles)))
+    inside = mass * (distances / radius)**2
+    speeds = spin * np.sqrt(Var.G * inside / np.maximum(distances, 1e-9))
+    positions = Var.window_size/2 + direction * distances[:, np.newaxis]
+    velocities = np.column_stack((-direction[:, 1], direction[:, 0])) * speeds[:, np.newaxis]
+    return positions, velocities, np.full(amount, 1.0), np.full(amount, mass / amount)
+
+def galaxy(amount:int, radius:float=300, core:float=1e5, mass:float=2e4, arms:int=2, seed:int=None):
+    """Heavy core with an exponential disk of stars on circular orbits, arms > 0 bunches them into log spirals"""
+    rng = np.random.default_rng(seed)
+    stars = amount - 1
+    scale = radius / 4
+    distances = np.minimum(rng.gamma(2, scale, stars) + 5, radius) # surface density ~ exp(-r/scale)
+    angles = rng.uniform(0, 2*pi, stars)
+    if arms:
+        arm = rng.integers(0, arms, stars)
+        angles = 2*pi * arm / arms + 3 * np.log(distances / scale) + rng.normal(0, 0.35, stars) # pitch and scatter
+    direction = np.column_stack((np.cos(angles), np.sin(angles)))
+    inside = core + mass * np.searchsorted(np.sort(distances), distances) / stars
+    speeds = np.sqrt(Var.G * inside / distances)
+
+    positions = np.vstack((Var.window_size/2, Var.window_size/2 + direction * distances[:, np.newaxis]))
+    velocities = np.vstack(((0, 0), np.column_stack((direction[:, 1], -direction[:, 0])) * speeds[:, np.newaxis]))
+    radii = np.concatenate(([10.0], np.full(stars, 1.0)))
+    masses = np.concatenate(([core], np.full(stars, mass / stars)))
+    return positions, velocities, radii, masses
+
+def lattice(rows:int, columns:int=None, spacing:float=20, radius:float=3, jitter:float=0.0, seed:int=None):
+    """Balls at rest on a square grid centered on the screen, jitter adds random velocities"""
+    columns = columns or rows
+    rng = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.arange(columns) - (columns - 1)/2, np.arange(rows) - (rows - 1)/2)
+    positions = Var.window_size/2 + spacing * np.column_stack((x.ravel(), y.ravel()))
+    velocities = rng.normal(0, jitter, positions.shape) if jitter else np.zeros(positions.shape)
+    return positions, velocities, np.full(len(positions), radius)
+
+def _isotropic(rng:np.random.Generator, amount:int) -> np.ndarray:
+    """x and y of random unit vectors in 3d"""
+    z = rng.uniform(-1, 1, amount)
+    angles = rng.uniform(0, 2*pi, amount)
+    return np.sqrt(1 - z**2)[:, np.newaxis] * np.column_stack((np.cos(angles), np.sin(angles)))
+
+def random_arrays():
+    """Arrays of a random orbit"""
+    arrangements = [figure_8(13)] + [ngon(x) for x in range(2,10)] + [sun_and_planets()]
+    return random.choice(arrangements)
+
+def get_preset(name:str):
+    """Arrays of a preset by name, e.g. 'figure_8', 'ngon:5', 'sun_and_planets', 'random',
+    the generators 'plummer:10000', 'disk:10000', 'galaxy:10000', 'lattice:100' or the path of a scene file.
+    The number of a generator is always the amount of balls. Generators take a seed as third part, 'plummer:10000:7',
+    and use seed 0 without one so a name is always the same setup"""
+    if os.path.splitext(name)[1] in scene.extensions:
+        return scene.load(name)
+    name, _, arg = name.partition(':')
+    arg, _, seed = arg.partition(':')
+    seed = int(seed or 0)
+    if name == 'figure_8':
+        return figure_8(float(arg or 13))
+    if name == 'ngon':
+        return ngon(int(arg or 3))
+    if name == 'sun_and_planets':
+        return sun_and_planets()
+    if name == 'random':
+        return random_arrays()
+    if name == 'plummer':
+        return plummer(int(arg or 1000), seed=seed)
+    if name == 'disk':
+        return uniform_disk(int(arg or 1000), seed=seed)
+    if name == 'galaxy':
+        return galaxy(int(arg or 1000), seed=seed)
+    if name == 'lattice': # amount of balls like the other generators, the last row may not be full
+        amount = int(arg or 100)
+        columns = int(np.ceil(np.sqrt(amount)))
+        return tuple(array[:amount] for array in lattice(-(-amount // max(columns, 1)), columns, seed=seed))
+    raise ValueError(f'unknown preset {name!r}')
+
+def to_balls(positions:np.ndarray, velocities:np.ndarray, radii:np.ndarray) -> list[Ball]:
+    """Wrap preset arrays into balls"""
+    from scripts.ui_elements import Bodies
+    return list(Bodies(positions, velocities, radii))
+
+def get_figure_8(scale:float) -> list[Ball]:
+    return to_balls(*figure_8(scale))
+
+def get_ngon(amount:int) -> list[Ball]:
+    return to_balls(*ngon(amount))
 
 def get_random() -> list[Ball]:
     """ ## Grow a pair
 
     Get a list of balls in a random orbit
     """
-    arrangements = [get_figure_8(13)] + [get_ngon(x) for x in range(2,10)]
-    arrangements.append([
-        Ball(75, (380, 400), (0, 1)),
-        Ball(20, (680, 400), (0, -10.66)),
-        Ball(20, (720, 400), (0, -3.33))
-    ])
-    return random.choice(arrangements)
\ No newline at end of file
+    return to_balls(*random_arrays())
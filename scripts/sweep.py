@@ -0,0 +1,119 @@
+"""Parameter sweep over presets, dt values and solvers on all cores
+
+python -m scripts.sweep --presets figure_8 ngon:5 --dt 0.01 0.03 --methods euler verlet --steps 20000 --out sweep"""
+from __future__ import annotations
+import argparse
+import itertools
+import os
+import time
+from multiprocessing import Pool, shared_memory
+import numpy as np
+from scripts.physics import PhysicsEngine
+from scripts.startpos import get_preset
+
+class SharedArray:
+    """Numpy array living in a named shared memory block, workers attach by name instead of pickling data"""
+    def __init__(self, shape:tuple, name:str=None):
+        self.shape = tuple(shape)
+        size = max(1, int(np.prod(self.shape)) * 8)
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.array = np.ndarray(self.shape, dtype=np.float64, buffer=self.memory.buf)
+
+    def __getstate__(self):
+        return self.shape, self.memory.name
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def close(self, unlink:bool=False):
+        del self.array
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+class Run:
+    """One simulation of the sweep, results go into shared arrays"""
+    def __init__(self, preset:str, dt:float, method:str, force:str, steps:int, every:int, arrays:tuple=None):
+        self.preset = preset
+        self.dt = dt
+        self.method = method
+        self.force = force
+        self.steps = steps
+        self.every = every
+        self.arrays = get_preset(preset) if arrays is None else arrays # runs of the same preset share these
+        frames = steps // every + 1
+        n = len(self.arrays[0])
+        self.trajectory = SharedArray((frames, n, 2))
+        self.energy = SharedArray((frames, 2)) # kinetic, potential
+
+    def __repr__(self):
+        return f'<Run {self.preset} dt:{self.dt} {self.method} {self.force}>'
+
+    @property
+    def name(self) -> str:
+        return f'{self.preset.replace(":", "")}_dt{self.dt}_{self.method}_{self.force}'
+
+def _work(job:tuple[int, Run]) -> tuple[int, float]:
+    """Worker, simulates one run straight into its shared arrays"""
+    index, run = job
+    engine = PhysicsEngine(run.dt)
+    engine.method = getattr(engine, f'{run.method}_step')
+    engine.force_method = getattr(engine, PhysicsEngine.force_methods[run.force])
+    engine.from_arrays(*run.arrays, update=False)
+    trajectory = run.trajectory.array
+    energy = run.energy.array
+
+    start = time.perf_counter()
+    for frame in range(len(trajectory)):
+        if frame:
+            engine.advance(run.every)
+        trajectory[frame] = engine.positions
+        energy[frame] = engine.kinetic(), engine.potential()
+    elapsed = time.perf_counter() - start
+
+    run.trajectory.close()
+    run.energy.close()
+    return index, elapsed
+
+def sweep(runs:list[Run], processes:int=None, verbose:bool=True) -> list[float]:
+    """Run everything on a process pool, returns the seconds each run took"""
+    times = [0.0] * len(runs)
+    start = time.perf_counter()
+    with Pool(processes) as pool:
+        for done, (index, elapsed) in enumerate(pool.imap_unordered(_work, enumerate(runs)), 1):
+            times[index] = elapsed
+            run = runs[index]
+            if verbose:
+                print(f'[{done}/{len(runs)}] {run.name}: {elapsed:.2f}s, {run.steps / max(elapsed, 1e-9):.0f} steps/s')
+    if verbose:
+        total = time.perf_counter() - start
+        print(f'{len(runs)} runs in {total:.2f}s, {sum(r.steps for r in runs) / max(total, 1e-9):.0f} steps/s overall')
+    return times
+
+def main(argv:list[str]=None):
+    parser = argparse.ArgumentParser(prog='python -m scripts.sweep', description=__doc__.splitlines()[0])
+    parser.add_argument('--presets', nargs='+', default=['figure_8'])
+    parser.add_argument('--dt', nargs='+', type=float, default=[0.03])
+    parser.add_argument('--methods', nargs='+', default=['euler'], choices=PhysicsEngine.methods)
+    parser.add_argument('--forces', nargs='+', default=['direct'], choices=list(PhysicsEngine.force_methods))
+    parser.add_argument('--steps', type=int, default=10000)
+    parser.add_argument('--every', type=int, default=20)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--out', default='sweep', help='directory for one .npz per run')
+    args = parser.parse_args(argv)
+
+    presets = {preset: get_preset(preset) for preset in args.presets}
+    runs = [Run(*combo, args.steps, args.every, presets[combo[0]]) for combo in itertools.product(args.presets, args.dt, args.methods, args.forces)]
+    try:
+        sweep(runs, args.processes)
+        os.makedirs(args.out, exist_ok=True)
+        for run in runs:
+            np.savez(os.path.join(args.out, f'{run.name}.npz'), dt=run.dt, positions=run.trajectory.array,
+                     kinetic=run.energy.array[:, 0], potential=run.energy.array[:, 1])
+    finally:
+        for run in runs:
+            run.trajectory.close(unlink=True)
+            run.energy.close(unlink=True)
+
+if __name__ == '__main__':
+    main()
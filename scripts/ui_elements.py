@@ -5,141 +5,194 @@ from pygame.locals import *
 from math import pi
 import numpy as np
 import random
+import time
 from scripts.const import Var, Fonts, Colors
+from scripts.profiler import Profiler, profiled
+
+def random_colors(amount:int) -> np.ndarray:
+    """Random pastel colors as (amount, 4) rgba array, same as pygame.Color.from_hsla(hue, 100, lightness, 100)"""
+    hue = np.random.uniform(0, 360, (amount, 1))
+    lightness = Var.cicrcle_lightness / 100
+    a = min(lightness, 1 - lightness)
+    k = (np.array((0, 8, 4)) + hue / 30) % 12
+    rgb = lightness - a * np.clip(np.minimum(k - 3, 9 - k), -1, 1)
+    colors = np.full((amount, 4), 255, dtype=np.uint8)
+    colors[:, :3] = rgb * 255
+    return colors
+
+class Bodies:
+    """Structure of arrays of everything that is drawn, balls are only views into it
+
+    positions, velocities, radii and masses are normally views of the physics engine,
+    see bind. Only colors and ids are owned here"""
+    def __init__(self, positions:np.ndarray, velocities:np.ndarray, radii:np.ndarray, masses:np.ndarray=None, colors:np.ndarray=None, ids:np.ndarray=None):
+        self.positions = np.array(positions, dtype=Var.dtype).reshape(-1, 2)
+        self.velocities = np.array(velocities, dtype=Var.dtype).reshape(-1, 2)
+        self.radii = np.array(radii, dtype=Var.dtype)
+        self.masses = pi * self.radii**2 if masses is None else np.array(masses, dtype=Var.dtype)
+        amount = len(self.positions)
+        self.colors = random_colors(amount) if colors is None else np.array(colors, dtype=np.uint8).reshape(-1, 4)
+        self.ids = np.random.randint(1, 1000, amount) if ids is None else np.array(ids, dtype=np.int64)
+
+    def __repr__(self):
+        return f'<Bodies amt:{len(self)}>'
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index:int) -> Ball:
+        return Ball(bodies=self, index=index)
+
+    def __iter__(self):
+        return (Ball(bodies=self, index=i) for i in range(len(self)))
+
+    @classmethod
+    def from_balls(cls, balls:list[Ball]) -> Bodies:
+        return cls(
+            [ball.pos for ball in balls],
+            [ball.vel for ball in balls],
+            [ball.radius for ball in balls],
+            [ball.mass for ball in balls],
+            [tuple(ball.color) for ball in balls],
+            [ball.id for ball in balls],
+        )
+
+    def copy(self) -> Bodies:
+        return Bodies(self.positions, self.velocities, self.radii, self.masses, self.colors, self.ids)
+
+    @profiled('update balls')
+    def bind(self, positions:np.ndarray, velocities:np.ndarray, radii:np.ndarray, masses:np.ndarray, copy:bool=False):
+        """Point at the arrays of the displayed frame, with copy they get copied into own arrays instead"""
+        if not len(positions) == len(velocities) == len(radii) == len(masses):
+            raise ValueError(f'bodies need one row per ball, got {len(positions)} positions, {len(velocities)} velocities, {len(radii)} radii and {len(masses)} masses')
+        if copy:
+            positions, velocities, radii, masses = (np.array(a) for a in (positions, velocities, radii, masses))
+        self.positions = positions
+        self.velocities = velocities
+        self.radii = radii
+        self.masses = masses
+
+    def append(self, ball:Ball):
+        self.positions = np.concatenate((self.positions, [ball.pos]))
+        self.velocities = np.concatenate((self.velocities, [ball.vel]))
+        self.radii = np.append(self.radii, ball.radius)
+        self.masses = np.append(self.masses, ball.mass)
+        self.colors = np.concatenate((self.colors, [tuple(ball.color)]))
+        self.ids = np.append(self.ids, ball.id)
+
+    def remove(self, index:int):
+        for name in ('positions', 'velocities', 'radii', 'masses', 'colors', 'ids'):
+            setattr(self, name, np.delete(getattr(self, name), index, axis=0))
+
+    def at(self, world_pos:np.ndarray) -> int:
+        """Index of the topmost ball under world_pos, -1 if there is none"""
+        inside = np.flatnonzero(np.sum((self.positions - world_pos)**2, axis=1) < self.radii**2)
+        return int(inside[-1]) if len(inside) else -1
 
 class Ball:
-    def __init__(self, radius:float=None, position:np.ndarray=None, velocity:np.ndarray=None, id:int=None, color:pygame.Color=None):
-        if id is None: self.id = random.randint(1, 999)
-        else: self.id = id
-        
-        if radius is None: self.radius = float(random.uniform(5, 50))
-        else:  self.radius = radius
+    """One ball, a view of row index in a Bodies. Without bodies it gets a Bodies of its own"""
+    __slots__ = ('bodies', 'index')
+
+    def __init__(self, radius:float=None, position:np.ndarray=None, velocity:np.ndarray=None, id:int=None, color:pygame.Color=None, bodies:Bodies=None, index:int=0):
+        if bodies is None:
+            if id is None: id = random.randint(1, 999)
+            if radius is None: radius = float(random.uniform(5, 50))
+            if position is None: position = [random.uniform(0, Var.window_size[0]), random.uniform(0, Var.window_size[1])]
+            if velocity is None: velocity = [random.uniform(-1, 1), random.uniform(-1, 1)]
+            colors = None if color is None else [tuple(pygame.Color(color))]
+            bodies = Bodies([position], [velocity], [radius], colors=colors, ids=[id])
+        self.bodies = bodies
+        self.index = index
 
-        if position is None: self.pos = np.array([random.uniform(0, Var.window_size[0]), random.uniform(0, Var.window_size[1])], dtype=np.float64)
-        else:  self.pos = np.array(position, dtype=np.float64)
+    def __repr__(self):
+        return f'Ball({self.radius}, {self.pos}, {self.vel}, {self.id}, {self.color})'
 
-        if velocity is None: self.vel = np.array([random.uniform(-1, 1), random.uniform(-1, 1)], dtype=np.float64)
-        else:  self.vel = np.array(velocity, dtype=np.float64)
+    @property
+    def pos(self) -> np.ndarray:
+        return self.bodies.positions[self.index]
 
-        if color is None: self.color = pygame.Color.from_hsla(random.uniform(0, 360), 100, 75, 100)
-        else: self.color = color
+    @pos.setter
+    def pos(self, val:np.ndarray):
+        self.bodies.positions[self.index] = val
 
-        self.mass = pi * self.radius**2
-        self.acc = np.zeros(2, dtype=np.float64)
-        self.prev_pos = self.pos.copy()
-        
-        self.pressed_left = False
-        self.pressed_right = False
-        self.pressed_ctrl = False
-        self.hover = False
-        self._radius = self.radius
-        self.surface = pygame.Surface((int(self.radius*2+1), int(self.radius*2+1)), SRCALPHA)
-        pygame.draw.aacircle(self.surface, self.color, (self.radius, self.radius), self.radius, 2)
+    @property
+    def vel(self) -> np.ndarray:
+        return self.bodies.velocities[self.index]
 
-    def __repr__(self):
-        return f'Ball({self.radius}, {self.pos}, {self.vel}, {self.id}, {self.color})'
+    @vel.setter
+    def vel(self, val:np.ndarray):
+        self.bodies.velocities[self.index] = val
 
     @property
     def radius(self) -> float:
-        return self._radius
-    
+        return float(self.bodies.radii[self.index])
+
     @radius.setter
     def radius(self, val:float):
-        self._radius = val
-        self.mass = pi * val**2
-
-    def distance_to(self, other:Ball):
-        """Calculate distance to another ball"""
-        return np.linalg.norm(self.pos - other.pos)
+        self.bodies.radii[self.index] = val
+        self.bodies.masses[self.index] = pi * val**2
 
-    def handle_event(self, event:pygame.Event, grid_size:float, camera):
-        """Handle all pygame events"""
-        calls = []
+    @property
+    def mass(self) -> float:
+        return float(self.bodies.masses[self.index])
 
-        if event.type == MOUSEBUTTONDOWN:
-            if self.hover:
-                if event.button == 1:
-                    self.pressed_left = True
-                elif event.button == 3:
-                    self.pressed_right = True
+    @property
+    def color(self) -> pygame.Color:
+        return pygame.Color(*self.bodies.colors[self.index])
 
-        elif event.type == MOUSEBUTTONUP:
-            if event.button == 1:
-                self.pressed_left = False
-            elif event.button == 3:
-                self.pressed_right = False
+    @color.setter
+    def color(self, val:pygame.Color):
+        self.bodies.colors[self.index] = tuple(pygame.Color(val))
 
-        elif event.type == MOUSEMOTION:
-            mouse_world_pos = camera.to_world_pos(np.array(event.pos))
-            # Calculate distance using numpy
-            self.hover = np.linalg.norm(mouse_world_pos - self.pos) < self.radius
-
-            if self.pressed_left and self.pressed_right:
-                calls.append('dragged_ball')
-                old = self.radius
-                if self.pressed_ctrl:
-                    diff = self.pos - mouse_world_pos
-                    # Snap to grid
-                    diff[0] = diff[0] - diff[0] % grid_size
-                    diff[1] = diff[1] - diff[1] % grid_size
-                    self.radius = np.linalg.norm(diff)
-                else:
-                    # Convert event.rel to numpy array
-                    rel = np.array(event.rel) * camera.zoom_val
-                    self.radius += np.sum(rel)
-
-                self.radius = min(max(1, self.radius), 10000)
-                if old != self.radius:
-                    self.draw()
-                
-            elif self.pressed_left:
-                calls.append('dragged_ball')
-                if self.pressed_ctrl:
-                    # Snap to grid
-                    mouse_pos = camera.to_world_pos(np.array(event.pos)) + np.array([grid_size/2, grid_size/2])
-                    mouse_pos[0] = mouse_pos[0] - mouse_pos[0] % grid_size
-                    mouse_pos[1] = mouse_pos[1] - mouse_pos[1] % grid_size
-                    self.pos = mouse_pos
-                else:
-                    # Move freely
-                    self.pos += np.array(event.rel) * camera.zoom_val
-
-            elif self.pressed_right:
-                calls.append('dragged_ball')
-                if self.pressed_ctrl:
-                    # Snap velocity
-                    diff = self.pos - camera.to_world_pos(np.array(event.pos)) + grid_size/2
-                    diff[0] = diff[0] - diff[0] % grid_size
-                    diff[1] = diff[1] - diff[1] % grid_size
-                    self.vel = -diff / 30
-                else:
-                    # Free velocity adjustment
-                    self.vel += np.array(event.rel) * camera.zoom_val / 30
-
-        elif event.type == KEYDOWN:
-            if event.key == K_r and self.hover:
-                # reset velocity
-                self.vel = np.zeros(2)
-                calls.append('pressed_r')
-            
-            if event.key == K_LCTRL:
-                self.pressed_ctrl = True
-
-        elif event.type == KEYUP:
-            if event.key == K_LCTRL:
-                self.pressed_ctrl = False
+    @property
+    def id(self) -> int:
+        return int(self.bodies.ids[self.index])
 
-        return calls
+    def distance_to(self, other:Ball):
+        """Calculate distance to another ball"""
+        return np.linalg.norm(self.pos - other.pos)
 
-    def copy(self):
-        b = Ball(self.radius, self.pos.copy(), self.vel.copy(), self.id)
-        b.color = self.color
-        return b
-        
-    def draw(self):
-        """Update the ball's surface"""
-        self.surface = pygame.Surface((int(self.radius*2+1), int(self.radius*2+1)), SRCALPHA)
-        pygame.draw.aacircle(self.surface, self.color, (self.radius, self.radius), self.radius, 2)
+    def drag(self, event:pygame.Event, grid_size:float, camera, left:bool, right:bool, snap:bool):
+        """Move the ball with the left, change its velocity with the right and its radius with both mouse buttons"""
+        mouse_world_pos = camera.to_world_pos(np.array(event.pos))
+        if left and right:
+            if snap:
+                diff = self.pos - mouse_world_pos
+                # Snap to grid
+                diff[0] = diff[0] - diff[0] % grid_size
+                diff[1] = diff[1] - diff[1] % grid_size
+                radius = np.linalg.norm(diff)
+            else:
+                # Convert event.rel to numpy array
+                rel = np.array(event.rel) * camera.zoom_val
+                radius = self.radius + np.sum(rel)
+            self.radius = min(max(1, radius), 10000)
+
+        elif left:
+            if snap:
+                # Snap to grid
+                mouse_pos = mouse_world_pos + np.array([grid_size/2, grid_size/2])
+                mouse_pos[0] = mouse_pos[0] - mouse_pos[0] % grid_size
+                mouse_pos[1] = mouse_pos[1] - mouse_pos[1] % grid_size
+                self.pos = mouse_pos
+            else:
+                # Move freely
+                self.pos += np.array(event.rel) * camera.zoom_val
+
+        elif right:
+            if snap:
+                # Snap velocity
+                diff = self.pos - mouse_world_pos + grid_size/2
+                diff[0] = diff[0] - diff[0] % grid_size
+                diff[1] = diff[1] - diff[1] % grid_size
+                self.vel = -diff / 30
+            else:
+                # Free velocity adjustment
+                self.vel += np.array(event.rel) * camera.zoom_val / 30
+
+    def copy(self) -> Ball:
+        """Standalone ball with the same values"""
+        return Ball(self.radius, self.pos.copy(), self.vel.copy(), self.id, self.color)
 
 class Button:
     def __init__(self, pos, text='button', color=None):
@@ -290,3 +343,49 @@ class EnergyGraph:
                 pygame.draw.aalines(self.surface, Colors.total_energy, False, total_points, 2)
 
         return self.surface
+
+class ProfileGraph:
+    """Profiler panel: mean and 95th percentile of every phase in ms, next to a histogram of its last frames
+
+    Redraws at most every interval seconds, so the panel does not become the slowest phase itself"""
+    def __init__(self, rect:pygame.Rect, bins:int=24, interval:float=0.1):
+        self.bins = bins
+        self.interval = interval
+        self.drawn = 0.0 # perf_counter of the last redraw
+        self.position = pygame.Rect(rect).topleft
+        self.size = pygame.Rect(rect).size
+        self.surface = pygame.Surface(self.size, pygame.SRCALPHA)
+
+    def resize(self, rect:pygame.Rect):
+        self.position = pygame.Rect(rect).topleft
+        self.size = pygame.Rect(rect).size
+        self.surface = pygame.Surface(self.size, pygame.SRCALPHA)
+
+    def draw(self, profiler:Profiler):
+        if time.perf_counter() - self.drawn < self.interval:
+            return self.surface
+        self.drawn = time.perf_counter()
+        self.surface.fill(Colors.profile_background)
+        stats = profiler.stats()
+        frame = stats.pop('frame', None)
+        if frame is None:
+            return self.surface
+
+        line = Fonts.small.get_height()
+        header = f'frame {frame["mean"]*1000:5.1f}ms p95 {frame["p95"]*1000:5.1f}ms {1/max(frame["mean"], 1e-9):4.0f}fps'
+        self.surface.blit(Fonts.small.render(header, True, Colors.text), (Var.pad, 0))
+
+        width = self.size[0] // 3 # of the histograms
+        left = self.size[0] - width - Var.pad
+        bar = width / self.bins
+        for row, (name, stat) in enumerate(list(stats.items())[:(self.size[1] - line) // line]):
+            y = line * (row + 1)
+            text = f'{name[:13]:<13}{stat["mean"]*1000:6.2f}{stat["p95"]*1000:6.2f}'
+            self.surface.blit(Fonts.small.render(text, True, Colors.text), (Var.pad, y))
+            counts, _ = np.histogram(profiler.history(name), self.bins, (0, max(stat['max'], 1e-9)))
+            heights = counts / max(counts.max(), 1) * (line - 2)
+            for index, height in enumerate(heights.tolist()):
+                if height:
+                    pygame.draw.rect(self.surface, Colors.profile_bar, (left + index * bar, y + line - 1 - height, max(bar - 1, 1), height))
+
+        return self.surface
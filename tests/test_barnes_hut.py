@@ -0,0 +1,55 @@
+"""Barnes-Hut at theta 0 opens every node down to single bodies, so it has to agree with direct summation"""
+import numpy as np
+import pytest
+from scripts import barnes_hut
+from scripts.physics import PhysicsEngine
+from scripts.settings import Var
+
+TOLERANCE = 1e-6 # relative, a deepest cell of many balls still acts as one point on balls outside of it
+
+def direct(positions:np.ndarray, masses:np.ndarray, softening:float=0.0) -> np.ndarray:
+    engine = PhysicsEngine(0.03)
+    engine.softening = softening
+    engine.from_arrays(positions, np.zeros_like(positions), np.ones(len(positions)), masses, update=False)
+    return engine.compute_accelerations()
+
+def error(positions:np.ndarray, masses:np.ndarray, theta:float=0.0, softening:float=0.0) -> float:
+    expected = direct(positions, masses, softening)
+    result = barnes_hut.accelerations(positions, masses, theta, Var.G, softening)
+    return float(np.max(np.linalg.norm(result - expected, axis=1) / np.linalg.norm(expected, axis=1)))
+
+def test_tight_pair_in_stretched_box():
+    """A pair closer than the deepest cell, the far balls stretch the box"""
+    positions = np.array([(0, 0), (800, 800), (400.006, 400.006), (400.006 + 1e-6, 400.006), (400.0185, 400.006)])
+    masses = np.full(len(positions), 10.0)
+    assert error(positions, masses) < TOLERANCE
+    assert error(positions, masses, theta=0.5) < TOLERANCE
+
+@pytest.mark.parametrize('seed', range(3))
+def test_clusters(seed:int):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0, 800, (5, 2))
+    positions = np.repeat(centers, 40, axis=0) + rng.normal(0, 1e-3, (200, 2))
+    positions[::50] += rng.uniform(-5000, 5000, (4, 2)) # outliers stretch the box
+    masses = rng.uniform(1, 100, len(positions))
+    assert error(positions, masses) < TOLERANCE
+
+def test_coincident():
+    """Balls on the same spot, softened so direct summation stays finite"""
+    rng = np.random.default_rng(0)
+    positions = np.repeat(rng.uniform(0, 800, (20, 2)), 3, axis=0)
+    masses = rng.uniform(1, 100, len(positions))
+    assert error(positions, masses, softening=1.0) < TOLERANCE
+
+def test_no_self_attraction():
+    """A wide opening angle must not let a ball pull on itself through a node around it"""
+    positions = np.array([(0, 0), (1, 0), (100, 0), (100, 1)], dtype=float)
+    masses = np.array([1.0, 1.0, 1e-9, 1e-9])
+    expected = direct(positions, masses)
+    result = barnes_hut.accelerations(positions, masses, 10.0, Var.G)
+    assert np.max(np.linalg.norm(result[:2] - expected[:2], axis=1)) < TOLERANCE * np.max(np.linalg.norm(expected[:2], axis=1))
+
+@pytest.mark.parametrize('amount', [0, 1])
+def test_tiny(amount:int):
+    positions = np.zeros((amount, 2))
+    assert barnes_hut.accelerations(positions, np.ones(amount), 0.5, Var.G).shape == (amount, 2)
@@ -0,0 +1,14 @@
+"""The numba backend has to match numpy, see scripts.kernels.parity"""
+import pytest
+
+pytest.importorskip('numba')
+
+from scripts.kernels import parity
+
+TOLERANCE = 1e-9 # relative, same as python -m scripts.kernels
+
+@pytest.mark.parametrize('softening, kernel', [(0.0, 'plummer'), (2.0, 'plummer'), (2.0, 'spline')])
+def test_parity(softening:float, kernel:str):
+    differences = parity(softening=softening, kernel=kernel)
+    differences.pop('100 steps') # chaotic, only shown for reference
+    assert all(difference <= TOLERANCE for difference in differences.values()), differences